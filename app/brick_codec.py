@@ -0,0 +1,195 @@
+"""
+Brick Codec — Columnar binary encoding of brick lists
+A small header, per-design type and color name tables, then one raw little-endian column per
+field; decoding wraps the buffer in NumPy views without copying it
+"""
+
+import json
+import struct
+from operator import countOf
+
+import numpy as np
+
+BRICKS_MAGIC = b"BRK1"
+
+# magic, brick count, byte length of the JSON name tables
+BRICKS_HEADER = struct.Struct("<4sII")
+
+# Column order on disk; type and color are indices into the name tables
+BRICK_COLUMNS = (
+    ("type", np.dtype("<u2")),
+    ("color", np.dtype("<u2")),
+    ("x", np.dtype("<i2")),
+    ("y", np.dtype("<i2")),
+    ("z", np.dtype("<i2")),
+    ("rotation", np.dtype("<i2")),
+)
+BRICK_FIELDS = frozenset(name for name, _ in BRICK_COLUMNS)
+BRICK_DEFAULTS = {"type": "2x4", "color": "red", "x": 0, "y": 0, "z": 0, "rotation": 0}
+
+INT16_MIN, INT16_MAX = -(1 << 15), (1 << 15) - 1
+MAX_NAMES = 1 << 16
+
+
+_MISSING = object()
+
+
+def _values(bricks, field):
+    """A field's values, defaults filled in, and how many bricks carry it"""
+    values = [b.get(field, _MISSING) for b in bricks]
+    missing = countOf(values, _MISSING)
+    if missing:
+        default = BRICK_DEFAULTS[field]
+        values = [default if v is _MISSING else v for v in values]
+    return values, len(values) - missing
+
+
+def _integers(values):
+    """int64 column of whole numbers, or None"""
+    kinds = set(map(type, values))  # type(), not isinstance: bools must not pass as numbers
+    if not kinds <= {int, float}:
+        return None
+    if float not in kinds:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+    column = np.array(values, dtype=np.float64)
+    if not np.isfinite(column).all() or not np.array_equal(column, np.round(column)):
+        return None
+    return column.astype(np.int64)
+
+
+def _names(values):
+    """Name table and uint16 codes of a string column, or (None, None)"""
+    if not set(map(type, values)) <= {str}:
+        return None, None
+    table = list(dict.fromkeys(values))
+    if len(table) > MAX_NAMES:
+        return None, None
+    index = {name: i for i, name in enumerate(table)}
+    return table, np.fromiter(map(index.__getitem__, values), dtype=np.uint16, count=len(values))
+
+
+def encode_bricks(bricks):
+    """Packed bytes of a brick list, or None when it does not fit the columns losslessly
+
+    Bricks with fields beyond type, color, x, y, z and rotation, fractional or out-of-range
+    coordinates, or non-string names are left to the caller to store as JSON.
+    """
+    if not set(map(type, bricks)) <= {dict}:
+        return None
+    fields, present = {}, 0
+    for name, _ in BRICK_COLUMNS:
+        fields[name], count = _values(bricks, name)
+        present += count
+    if present != sum(map(len, bricks)):
+        return None  # some brick has a field the columns cannot hold
+
+    types, type_codes = _names(fields["type"])
+    colors, color_codes = _names(fields["color"])
+    if types is None or colors is None:
+        return None
+    columns = {"type": type_codes, "color": color_codes}
+    for name in ("x", "y", "z", "rotation"):
+        column = _integers(fields[name])
+        if column is None or (len(column) and (column.min() < INT16_MIN or column.max() > INT16_MAX)):
+            return None
+        columns[name] = column
+
+    return _pack(types, colors, columns)
+
+
+def _pack(types, colors, columns):
+    """Packed bytes of name tables and integer columns already known to fit"""
+    tables = json.dumps({"types": types, "colors": colors}, separators=(",", ":")).encode()
+    tables += b" " * (-(BRICKS_HEADER.size + len(tables)) % 8)
+    parts = [BRICKS_HEADER.pack(BRICKS_MAGIC, len(columns["x"]), len(tables)), tables]
+    parts += [columns[name].astype(dtype).tobytes() for name, dtype in BRICK_COLUMNS]
+    return b"".join(parts)
+
+
+class BrickColumns:
+    """Zero-copy column views over packed bricks; dicts are only built on request"""
+
+    def __init__(self, types, colors, columns):
+        self.types = types
+        self.colors = colors
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["x"])
+
+    def brick(self, i):
+        c = self.columns
+        return {"type": self.types[c["type"][i]], "x": int(c["x"][i]), "y": int(c["y"][i]),
+                "z": int(c["z"][i]), "color": self.colors[c["color"][i]], "rotation": int(c["rotation"][i])}
+
+    def to_dicts(self):
+        c = self.columns
+        types = [self.types[i] for i in c["type"].tolist()]
+        colors = [self.colors[i] for i in c["color"].tolist()]
+        return [
+            {"type": t, "x": x, "y": y, "z": z, "color": color, "rotation": r}
+            for t, x, y, z, color, r in zip(types, c["x"].tolist(), c["y"].tolist(), c["z"].tolist(),
+                                            colors, c["rotation"].tolist())
+        ]
+
+
+def decode_bricks(buffer):
+    """BrickColumns viewing a buffer written by encode_bricks"""
+    magic, count, tables_size = BRICKS_HEADER.unpack_from(buffer)
+    if magic != BRICKS_MAGIC:
+        raise ValueError("Not a packed brick buffer")
+    offset = BRICKS_HEADER.size
+    tables = json.loads(bytes(buffer[offset:offset + tables_size]))
+    offset += tables_size
+    columns = {}
+    for name, dtype in BRICK_COLUMNS:
+        columns[name] = np.frombuffer(buffer, dtype, count, offset)
+        offset += count * dtype.itemsize
+    return BrickColumns(tables["types"], tables["colors"], columns)
+
+
+def _merge_names(table, names, codes):
+    """codes into names, re-coded against table (which gains any names it lacks), or None if it overflows"""
+    index = {name: i for i, name in enumerate(table)}
+    for name in names:
+        if name not in index:
+            index[name] = len(table)
+            table.append(name)
+    if len(table) > MAX_NAMES:
+        return None
+    return np.array([index[name] for name in names], dtype=np.int64)[codes]
+
+
+def patch_bricks(buffer, removed=(), replaced=None, added=()):
+    """A packed buffer edited without expanding it to dicts, or None if the new bricks do not fit
+
+    removed and the keys of replaced are brick indices into buffer, replaced maps indices to
+    whole new brick dicts, and added bricks are appended after the rest.
+    """
+    replaced = replaced or {}
+    base = decode_bricks(buffer)
+    extra_buffer = encode_bricks(list(replaced.values()) + list(added))
+    if extra_buffer is None:
+        return None
+    extra = decode_bricks(extra_buffer)
+    types, colors = list(base.types), list(base.colors)
+    codes = {
+        "type": _merge_names(types, extra.types, extra.columns["type"]),
+        "color": _merge_names(colors, extra.colors, extra.columns["color"]),
+    }
+    if codes["type"] is None or codes["color"] is None:
+        return None
+
+    keep = np.ones(len(base), dtype=bool)
+    keep[np.fromiter(removed, dtype=np.int64)] = False
+    at = np.fromiter(replaced, dtype=np.int64, count=len(replaced))
+    columns = {}
+    for name, _ in BRICK_COLUMNS:
+        values = codes.get(name, extra.columns[name])
+        column = base.columns[name].astype(np.int64)
+        column[at] = values[:len(at)]
+        columns[name] = np.concatenate([column[keep], values[len(at):]])
+    return _pack(types, colors, columns)
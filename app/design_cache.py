@@ -0,0 +1,105 @@
+"""
+Design Cache — Process-wide LRU of decoded designs, bounded by estimated memory
+Saved and shared designs are kept as parsed dicts so repeat loads skip the database read, the
+brick decode and the JSON parse; writers invalidate entries before their save returns
+"""
+
+import threading
+from collections import OrderedDict
+
+# Rough in-memory cost of decoded JSON: a brick dict unpacked from columns takes ~300 bytes, and
+# parsed JSON in general ~5 bytes per byte of text
+BYTES_PER_BRICK = 320
+BYTES_PER_JSON_BYTE = 5
+
+# Invalidation marks kept per key; past this they are dropped and older reads are refused instead
+MAX_INVALIDATION_MARKS = 4096
+
+
+def estimate_bytes(json_bytes=0, bricks=0):
+    """Estimated memory of a decoded design from its JSON text size and count of unpacked bricks"""
+    return json_bytes * BYTES_PER_JSON_BYTE + bricks * BYTES_PER_BRICK
+
+
+class DesignCache:
+    """Thread-safe LRU of decoded values, bounded by their estimated total bytes
+
+    Values are shared between callers and must be treated as read-only. A reader that misses
+    takes generation() before loading and passes it to put(), which drops the value if the key
+    was invalidated meanwhile, so a load racing a save can never cache the older design.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._invalidated = {}  # key -> generation of its last invalidation
+        self._floor = 0  # reads that started before this generation may be stale
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        """Cached value for a key, or None; refreshes its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size, generation):
+        """Cache a value loaded since generation, evicting the least recently used past the budget"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation < self._floor or self._invalidated.get(key, -1) > generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a key and refuse values for it from loads already in flight"""
+        with self._lock:
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            if len(self._invalidated) > MAX_INVALIDATION_MARKS:
+                self._invalidated.clear()
+                self._floor = self._generation
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+                self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
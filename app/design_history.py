@@ -0,0 +1,200 @@
+"""
+Design History — Brick-level deltas between saved versions of a design
+A version's bricks are a sequence of hashable elements: (type, x, y, z, color, rotation) tuples
+when the design's bricks are packed, or each brick's (key, value) pairs otherwise. A delta is
+the list of edit ops turning the previous version's sequence into the next one
+"""
+
+import json
+import zlib
+from difflib import SequenceMatcher
+
+try:
+    from app.brick_codec import BRICK_DEFAULTS, decode_bricks
+except ImportError:
+    try:
+        from brick_codec import BRICK_DEFAULTS, decode_bricks
+    except ImportError:
+        BRICK_DEFAULTS, decode_bricks = {}, None
+
+# Element encodings: packed bricks become field tuples, anything else keeps its key/value pairs
+COLUMNS = "columns"
+ITEMS = "items"
+COLUMN_FIELDS = ("type", "x", "y", "z", "color", "rotation")
+POSITION = (1, 2, 3)
+COLOR = 4
+
+# A snapshot is stored at least every SNAPSHOT_INTERVAL versions, bounding reconstruction work
+SNAPSHOT_INTERVAL = 32
+
+# Deltas bigger than this fraction of the design's packed size are stored as a snapshot instead
+SNAPSHOT_RATIO = 0.5
+
+# After a mismatch, the sequences count as lined up again at the first run of RESYNC_RUN equal
+# elements found within RESYNC_WINDOW of it (the window grows if there is none)
+RESYNC_WINDOW = 32
+RESYNC_RUN = 4
+
+ZLIB_LEVEL = 6
+
+
+# ========== ELEMENTS ==========
+
+def packed_elements(packed):
+    """Field tuples of a brick_codec buffer, in order"""
+    columns = decode_bricks(packed)
+    c = columns.columns
+    types = [columns.types[i] for i in c["type"].tolist()]
+    colors = [columns.colors[i] for i in c["color"].tolist()]
+    return list(zip(types, c["x"].tolist(), c["y"].tolist(), c["z"].tolist(), colors, c["rotation"].tolist()))
+
+
+def column_element(brick):
+    """Field tuple of one brick dict that packs, as it will read back from the packed buffer"""
+    return (
+        brick.get("type", BRICK_DEFAULTS["type"]), int(brick.get("x", 0)), int(brick.get("y", 0)),
+        int(brick.get("z", 0)), brick.get("color", BRICK_DEFAULTS["color"]), int(brick.get("rotation", 0)),
+    )
+
+
+def item_elements(bricks):
+    """(key, value) pair tuples of JSON brick dicts"""
+    return [tuple(b.items()) for b in bricks]
+
+
+def to_bricks(elements, encoding):
+    if encoding == COLUMNS:
+        return [dict(zip(COLUMN_FIELDS, e)) for e in elements]
+    return [dict(e) for e in elements]
+
+
+def _hashable(raw, encoding):
+    """Elements read back from JSON, where tuples came back as lists"""
+    if encoding == COLUMNS:
+        return [tuple(e) for e in raw]
+    return [tuple(tuple(pair) for pair in e) for e in raw]
+
+
+# ========== DELTAS ==========
+
+def diff(previous, current, encoding):
+    """JSON-ready edit ops turning previous into current, plus added/removed/moved/recolored counts
+
+    Ops index into previous: ["d", i1, i2] drops previous[i1:i2], ["i", i1, elements] inserts
+    before previous[i1], ["r", i1, i2, elements] replaces previous[i1:i2]. Both sequences are
+    walked in lockstep; at each mismatch a small window is matched to find where they line up
+    again, so the cost is one pass plus a little per edit rather than quadratic in the span.
+    """
+    ops, counts = [], {"added": 0, "removed": 0, "moved": 0, "recolored": 0}
+    i, j, n, m = 0, 0, len(previous), len(current)
+    while True:
+        while i < n and j < m and previous[i] == current[j]:
+            i += 1
+            j += 1
+        if i == n or j == m:
+            _emit(ops, counts, previous, current, i, n, j, m, encoding)
+            return ops, counts
+        window, anchor = RESYNC_WINDOW, None
+        while anchor is None:
+            blocks = SequenceMatcher(None, previous[i:i + window], current[j:j + window], autojunk=False)
+            anchor = next((blk for blk in blocks.get_matching_blocks() if blk.size >= RESYNC_RUN), None)
+            if i + window >= n and j + window >= m:
+                break
+            window *= 4
+        if anchor is None:
+            _emit(ops, counts, previous, current, i, n, j, m, encoding)
+            return ops, counts
+        _emit(ops, counts, previous, current, i, i + anchor.a, j, j + anchor.b, encoding)
+        i += anchor.a
+        j += anchor.b
+
+
+def _emit(ops, counts, previous, current, i1, i2, j1, j2, encoding):
+    """The op replacing previous[i1:i2] with current[j1:j2], if they differ"""
+    if i1 == i2 and j1 == j2:
+        return
+    if j1 == j2:
+        ops.append(["d", i1, i2])
+    elif i1 == i2:
+        ops.append(["i", i1, current[j1:j2]])
+    else:
+        ops.append(["r", i1, i2, current[j1:j2]])
+    paired = min(i2 - i1, j2 - j1)
+    counts["removed"] += i2 - i1 - paired
+    counts["added"] += j2 - j1 - paired
+    for old, new in zip(previous[i1:i1 + paired], current[j1:j1 + paired]):
+        _count_change(old, new, encoding, counts)
+
+
+def edit_ops(previous, removed, replaced, added, length, encoding):
+    """History ops and counts of known edits, without diffing
+
+    previous maps each removed or replaced index to its old element, replaced maps indices to new
+    elements, and added elements go after the last of length previous ones.
+    """
+    ops, counts = [], {"added": len(added), "removed": 0, "moved": 0, "recolored": 0}
+    for i in sorted(set(removed) | set(replaced)):
+        if i in replaced:
+            ops.append(["r", i, i + 1, [replaced[i]]])
+            _count_change(previous[i], replaced[i], encoding, counts)
+        else:
+            ops.append(["d", i, i + 1])
+            counts["removed"] += 1
+    if added:
+        ops.append(["i", length, list(added)])
+    return ops, counts
+
+
+def _count_change(old, new, encoding, counts):
+    """A replaced brick counts as moved, recolored, or both"""
+    if encoding == COLUMNS:
+        moved = any(old[i] != new[i] for i in POSITION)
+        recolored = old[COLOR] != new[COLOR]
+    else:
+        old, new = dict(old), dict(new)
+        moved = any(old.get(k) != new.get(k) for k in ("x", "y", "z"))
+        recolored = old.get("color") != new.get("color")
+    counts["moved"] += moved
+    counts["recolored"] += recolored
+
+
+def apply(previous, ops, encoding):
+    """The element sequence a delta's ops produce from previous, built front to back"""
+    out, pos = [], 0
+    for op in ops:
+        out.extend(previous[pos:op[1]])
+        if op[0] == "i":
+            out.extend(_hashable(op[2], encoding))
+            pos = op[1]
+        elif op[0] == "d":
+            pos = op[2]
+        else:
+            out.extend(_hashable(op[3], encoding))
+            pos = op[2]
+    out.extend(previous[pos:])
+    return out
+
+
+# ========== STORAGE ==========
+
+def pack(value):
+    """zlib-compressed compact JSON"""
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode(), ZLIB_LEVEL)
+
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def pack_snapshot(bricks, encoding, packed=None):
+    """Stored form of a full version: the compressed brick_codec buffer, or the bricks as JSON"""
+    if encoding == COLUMNS:
+        return zlib.compress(packed, ZLIB_LEVEL)
+    return pack(bricks)
+
+
+def unpack_snapshot(blob, encoding):
+    """Elements of a stored full version"""
+    if encoding == COLUMNS:
+        return packed_elements(zlib.decompress(blob))
+    return item_elements(unpack(blob))
@@ -0,0 +1,162 @@
+"""
+Design Index — In-process counters over saved designs, shares and screenshots
+Built once at startup, updated by the handlers that write, and re-synced in the background
+whenever the files behind them change on disk, so stats never scan a directory or a table
+"""
+
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+try:
+    from app.design_store import design_summary
+except ImportError:
+    from design_store import design_summary
+
+RECONCILE_SECONDS = 30.0
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class DesignIndex:
+    """Summaries of every stored design with running per-mode, tag and category counts"""
+
+    def __init__(self, store):
+        self.store = store
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._modes = Counter()
+        self._tags = Counter()
+        self._categories = Counter()
+        self._signature = None
+        self.rebuild()
+
+    def _disk_signature(self):
+        """mtimes of the database and its write-ahead log, which move on every commit"""
+        return _mtime(self.store.path), _mtime(self.store.path.with_name(self.store.path.name + "-wal"))
+
+    def _add(self, summary):
+        self._discard(summary["id"])
+        self._summaries[summary["id"]] = summary
+        self._modes[summary["mode"]] += 1
+        self._tags.update(set(summary["tags"]))
+        self._categories.update(set(summary["categories"]))
+
+    def _discard(self, design_id):
+        summary = self._summaries.pop(design_id, None)
+        if summary is None:
+            return
+        self._modes[summary["mode"]] -= 1
+        self._tags.subtract(set(summary["tags"]))
+        self._categories.subtract(set(summary["categories"]))
+        for counter in (self._modes, self._tags, self._categories):
+            for key in [k for k, n in counter.items() if n <= 0]:
+                del counter[key]
+
+    def rebuild(self):
+        """Reload every summary from the store"""
+        signature = self._disk_signature()  # taken first, so a write during the read shows up next time
+        summaries = self.store.summaries()
+        with self._lock:
+            self._summaries = {}
+            self._modes, self._tags, self._categories = Counter(), Counter(), Counter()
+            for summary in summaries:
+                self._add(summary)
+            self._signature = signature
+            self.rebuilds += 1
+
+    def reconcile(self):
+        """Rebuild if the database changed behind the index's back; True if it did"""
+        if self._disk_signature() == self._signature:
+            return False
+        self.rebuild()
+        return True
+
+    def saved(self, design):
+        """Record a design just written to the store"""
+        with self._lock:
+            self._add(design_summary(design))
+            self._signature = self._disk_signature()
+
+    def deleted(self, design_id):
+        """Record a design just removed from the store"""
+        with self._lock:
+            self._discard(design_id)
+            self._signature = self._disk_signature()
+
+    def __len__(self):
+        return len(self._summaries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "designs": len(self._summaries),
+                "by_mode": dict(self._modes),
+                "tags": len(self._tags),
+                "categories": len(self._categories),
+            }
+
+
+class FileIndex:
+    """Names of the files matching a glob in one directory"""
+
+    def __init__(self, directory, pattern):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._names = set()
+        self._signature = None
+        self.rebuild()
+
+    def rebuild(self):
+        signature = _mtime(self.directory)
+        names = {f.name for f in self.directory.glob(self.pattern)}
+        with self._lock:
+            self._names = names
+            self._signature = signature
+            self.rebuilds += 1
+
+    def reconcile(self):
+        """Rescan if files were added or removed behind the index's back; True if it did"""
+        if _mtime(self.directory) == self._signature:
+            return False
+        self.rebuild()
+        return True
+
+    def added(self, name):
+        with self._lock:
+            self._names.add(name)
+            self._signature = _mtime(self.directory)
+
+    def removed(self, name):
+        with self._lock:
+            self._names.discard(name)
+            self._signature = _mtime(self.directory)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def start_reconciler(indexes, interval=RECONCILE_SECONDS):
+    """Daemon thread reconciling each index with disk every interval seconds"""
+    def run():
+        while True:
+            time.sleep(interval)
+            for index in indexes:
+                try:
+                    index.reconcile()
+                except (OSError, sqlite3.Error) as e:
+                    print(f"Warning: index reconcile failed: {e}")
+
+    thread = threading.Thread(target=run, name="design-index-reconciler", daemon=True)
+    thread.start()
+    return thread
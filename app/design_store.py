@@ -0,0 +1,675 @@
+"""
+Design Store — Saved designs in an embedded SQLite database
+Metadata (name, mode, counts, timestamps, tags, categories) lives in indexed columns next to the
+design payload, so the gallery lists a page of designs without parsing any of them. Bricks are
+stored as a columnar binary blob when NumPy is available, and as JSON inside the payload otherwise.
+Every save is fsynced to the write-ahead log before it returns; concurrent saves share one commit.
+Each save also appends a version: a brick-level delta against the previous one, or a periodic
+full snapshot. Patches edit a stored design's bricks in place against the version they were made on
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+try:
+    from app import brick_codec
+except ImportError:
+    try:
+        import brick_codec
+    except ImportError:
+        brick_codec = None
+
+try:
+    from app import design_history
+    from app.design_cache import estimate_bytes
+except ImportError:
+    import design_history
+    from design_cache import estimate_bytes
+
+DB_FILENAME = "designs.sqlite3"
+
+# Sortable listing columns; each has an index on (column, id) for keyset pagination
+SORT_COLUMNS = ("created_at", "updated_at", "name", "brick_count")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS designs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    brick_count INTEGER NOT NULL,
+    shape_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    tags TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    bricks BLOB
+);
+CREATE INDEX IF NOT EXISTS designs_created ON designs (created_at, id);
+CREATE INDEX IF NOT EXISTS designs_updated ON designs (updated_at, id);
+CREATE INDEX IF NOT EXISTS designs_name ON designs (name, id);
+CREATE INDEX IF NOT EXISTS designs_bricks ON designs (brick_count, id);
+CREATE INDEX IF NOT EXISTS designs_mode ON designs (mode, created_at, id);
+CREATE TABLE IF NOT EXISTS design_labels (
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL,
+    design_id TEXT NOT NULL REFERENCES designs (id) ON DELETE CASCADE,
+    PRIMARY KEY (kind, label, design_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS design_labels_design ON design_labels (design_id);
+CREATE TABLE IF NOT EXISTS design_versions (
+    design_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    encoding TEXT NOT NULL,
+    brick_count INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    moved INTEGER NOT NULL,
+    recolored INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    meta BLOB NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (design_id, version)
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+SUMMARY_COLUMNS = "id, name, mode, brick_count, shape_count, created_at, updated_at, tags, categories"
+
+# Version listing columns; the meta and data blobs come last in each row so listing never reads them
+VERSION_COLUMNS = "version, created_at, kind, brick_count, added, removed, moved, recolored, size"
+
+# Top-level design fields a patch may replace alongside its brick ops
+PATCH_FIELDS = ("name", "mode", "shapes", "camera", "tags", "categories")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPatch(ValueError):
+    pass
+
+
+class VersionConflict(Exception):
+    """A patch was made against a version that is no longer the design's latest"""
+
+    def __init__(self, version):
+        super().__init__(f"Design is at version {version}")
+        self.version = version
+
+
+class _PendingWrite:
+    """A row, or a patch to turn into one, waiting for the next group commit"""
+
+    def __init__(self, design, row, patch=None):
+        self.design = design
+        self.row = row
+        self.patch = patch
+        self.version = None
+        self.done = False
+        self.error = None
+
+
+def write_atomic(path, data):
+    """Replace a file with bytes via a synced temp file and a rename: readers see all or nothing"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if os.name == "posix":
+        # Persist the rename itself
+        fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def encode_cursor(value, design_id):
+    """Opaque page cursor: the sort value and id of the last design on a page"""
+    raw = json.dumps([value, design_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        value, design_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    return value, design_id
+
+
+def design_summary(design):
+    """Listing entry of a design dict"""
+    metadata = design.get("metadata", {})
+    created_at = design.get("created_at") or time.time()
+    return {
+        "id": str(design["id"]),
+        "name": str(design.get("name", f"design-{design['id']}")),
+        "mode": str(design.get("mode", "lego")),
+        "brick_count": int(metadata.get("brick_count", len(design.get("bricks", [])))),
+        "shape_count": int(metadata.get("shape_count", len(design.get("shapes", [])))),
+        "created_at": float(created_at),
+        "updated_at": float(design.get("updated_at") or created_at),
+        "tags": list(design.get("tags", [])),
+        "categories": list(design.get("categories", [])),
+    }
+
+
+def design_row(design, packed=None):
+    """Column values of a design dict: its summary, packed bricks and the JSON payload of the rest
+
+    Bricks that do not pack losslessly (see brick_codec.encode_bricks) stay in the payload. A
+    design whose bricks are already packed is passed without them, and packed alongside.
+    """
+    row = design_summary(design)
+    if packed is None:
+        packed = brick_codec.encode_bricks(design.get("bricks", [])) if brick_codec else None
+    payload = design if packed is None else {k: v for k, v in design.items() if k != "bricks"}
+    return {
+        **row,
+        "tags": json.dumps(row["tags"]),
+        "categories": json.dumps(row["categories"]),
+        "payload": json.dumps(payload, separators=(",", ":")),
+        "bricks": packed,
+    }
+
+
+def parse_patch(ops, count):
+    """Removed indices, {index: changed fields} and added bricks of patch ops on count bricks
+
+    Bricks are addressed by their index in the version the patch was made against:
+    {"op": "add", "brick": {...}}, {"op": "remove", "id": 3}, {"op": "update", "id": 5, "set": {...}}.
+    """
+    if not isinstance(ops, list):
+        raise InvalidPatch("ops must be a list")
+    removed, updates, added = set(), {}, []
+    for op in ops:
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind == "add":
+            if not isinstance(op.get("brick"), dict):
+                raise InvalidPatch("add needs a brick object")
+            added.append(op["brick"])
+            continue
+        if kind not in ("remove", "update"):
+            raise InvalidPatch(f"Unknown op: {kind}")
+        i = op.get("id")
+        if type(i) is not int or not 0 <= i < count:
+            raise InvalidPatch(f"No brick with id {i}")
+        if i in removed:
+            raise InvalidPatch(f"Brick {i} is already removed")
+        if kind == "remove":
+            removed.add(i)
+            updates.pop(i, None)
+        else:
+            if not isinstance(op.get("set"), dict):
+                raise InvalidPatch("update needs a set object")
+            updates[i] = {**updates.get(i, {}), **op["set"]}
+    return removed, updates, added
+
+
+def row_summary(row):
+    """Listing entry of a summary row"""
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "mode": row["mode"],
+        "brick_count": row["brick_count"],
+        "shape_count": row["shape_count"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "tags": json.loads(row["tags"]),
+        "categories": json.loads(row["categories"]),
+    }
+
+
+class DesignStore:
+    """Thread-safe SQLite store of saved designs with indexed, cursor-paginated listing
+
+    Writes go through one connection under a lock; each reading thread gets its own read-only
+    connection, which WAL mode lets run alongside the writer. Saves are group-committed: whichever
+    waiting save takes the lock commits every row queued so far in one transaction and one fsync.
+    """
+
+    def __init__(self, path, cache=None):
+        self.path = Path(path)
+        self.cache = cache  # optional DesignCache that get_versioned reads through
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._queue = []
+        self._committing = False
+        self._queue_changed = threading.Condition()
+        self.commits = 0
+        self.committed_rows = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # fsync the WAL on every commit
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(designs)")}
+            if "bricks" not in columns:
+                # Databases created before bricks were packed keep theirs in the payload
+                self._conn.execute("ALTER TABLE designs ADD COLUMN bricks BLOB")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+
+    def _reader(self):
+        """This thread's read-only connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = self.path.resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def _write(self, row):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO designs VALUES "
+            "(:id, :name, :mode, :brick_count, :shape_count, :created_at, :updated_at, :tags, :categories, :payload, :bricks)",
+            row,
+        )
+        self._conn.execute("DELETE FROM design_labels WHERE design_id = ?", (row["id"],))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO design_labels VALUES (?, ?, ?)",
+            [("tag", str(t), row["id"]) for t in json.loads(row["tags"])]
+            + [("category", str(c), row["id"]) for c in json.loads(row["categories"])],
+        )
+
+    def _record_version(self, write, ops=None, counts=None):
+        """Append the next version of a design, inside the caller's transaction
+
+        Runs before the designs row is replaced, so the previous version's bricks are read from
+        the row the previous save left. A patch passes the ops and counts it already knows.
+        """
+        row, design = write.row, write.design
+        design_id, packed, bricks = row["id"], row["bricks"], design.get("bricks", [])
+        encoding = design_history.COLUMNS if packed is not None else design_history.ITEMS
+        last = self._conn.execute(
+            "SELECT version, encoding FROM design_versions WHERE design_id = ? ORDER BY version DESC LIMIT 1",
+            (design_id,),
+        ).fetchone()
+        version = last["version"] + 1 if last else 1
+
+        if not (last and last["encoding"] == encoding):
+            ops, counts = None, {"added": row["brick_count"], "removed": 0, "moved": 0, "recolored": 0}
+        elif ops is None:
+            ops, counts = self._delta(design_id, encoding, bricks, packed)
+        data, kind = None, "snapshot"
+        if ops is not None:
+            snapshot = self._conn.execute(
+                "SELECT version FROM design_versions WHERE design_id = ? AND kind = 'snapshot' "
+                "ORDER BY version DESC LIMIT 1",
+                (design_id,),
+            ).fetchone()
+            if version - snapshot["version"] < design_history.SNAPSHOT_INTERVAL:
+                data, kind = design_history.pack(ops), "delta"
+                if ops and len(data) > design_history.SNAPSHOT_RATIO * len(packed or row["payload"]):
+                    data, kind = None, "snapshot"
+        if data is None:
+            data = design_history.pack_snapshot(bricks, encoding, packed)
+        meta = design_history.pack({k: v for k, v in design.items() if k != "bricks"})
+        self._conn.execute(
+            "INSERT INTO design_versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (design_id, version, row["updated_at"], kind, encoding, row["brick_count"],
+             counts["added"], counts["removed"], counts["moved"], counts["recolored"],
+             len(meta) + len(data), meta, data),
+        )
+        write.version = version
+
+    def _delta(self, design_id, encoding, bricks, packed):
+        """Ops and counts from the stored design's bricks to the new ones; ops is None if they cannot diff"""
+        previous = self._conn.execute("SELECT payload, bricks FROM designs WHERE id = ?", (design_id,)).fetchone()
+        counts = {"added": len(bricks), "removed": 0, "moved": 0, "recolored": 0}
+        if previous is None or (previous["bricks"] is None) != (packed is None):
+            return None, counts
+        if encoding == design_history.COLUMNS:
+            if previous["bricks"] == packed:
+                return [], {**counts, "added": 0}  # bricks untouched, e.g. a rename or retag
+            old = design_history.packed_elements(previous["bricks"])
+            new = design_history.packed_elements(packed)
+        else:
+            try:
+                old = design_history.item_elements(json.loads(previous["payload"]).get("bricks", []))
+                new = design_history.item_elements(bricks)
+            except AttributeError:
+                return None, counts  # bricks that are not objects are only ever snapshotted
+        try:
+            return design_history.diff(old, new, encoding)
+        except TypeError:
+            return None, counts  # a brick value is unhashable
+
+    def _patch(self, write):
+        """Turn a queued patch into the design's next row and version, inside the caller's transaction
+
+        Packed bricks are edited as columns and the version's delta comes straight from the ops,
+        so the work is proportional to the edit rather than the design. Leaves write.version None
+        if the design does not exist.
+        """
+        design_id, base_version, ops, fields, updated_at = write.patch
+        current = self._conn.execute("SELECT payload, bricks FROM designs WHERE id = ?", (design_id,)).fetchone()
+        if current is None:
+            return
+        version = self._latest_version(self._conn, design_id)
+        if version != base_version:
+            raise VersionConflict(version)
+        design, packed = json.loads(current["payload"]), current["bricks"]
+        base = brick_codec.decode_bricks(packed) if packed is not None else None
+        count = len(base) if base is not None else len(design.get("bricks", []))
+        removed, updates, added = parse_patch(ops, count)
+        design.update(fields)
+        design["updated_at"] = updated_at
+        design["metadata"] = {
+            **design.get("metadata", {}),
+            "brick_count": count - len(removed) + len(added),
+            "shape_count": len(design.get("shapes", [])),
+        }
+
+        if base is not None:
+            replaced = {i: {**base.brick(i), **changes} for i, changes in updates.items()}
+            new = brick_codec.patch_bricks(packed, removed, replaced, added)
+            if new is not None:
+                old = {i: design_history.column_element(base.brick(i)) for i in removed | set(updates)}
+                ops, counts = design_history.edit_ops(
+                    old, removed,
+                    {i: design_history.column_element(b) for i, b in replaced.items()},
+                    [design_history.column_element(b) for b in added],
+                    count, design_history.COLUMNS,
+                )
+                write.design, write.row = design, design_row(design, packed=new)
+                self._record_version(write, ops, counts)
+                self._write(write.row)
+                return
+            bricks = base.to_dicts()  # the edit needs fields the columns cannot hold
+        else:
+            bricks = design.get("bricks", [])
+        try:
+            bricks = [{**b, **updates[i]} if i in updates else b for i, b in enumerate(bricks) if i not in removed]
+        except TypeError as e:
+            raise InvalidPatch("Stored bricks are not objects") from e
+        design["bricks"] = bricks + added
+        write.design, write.row = design, design_row(design)
+        self._record_version(write)
+        self._write(write.row)
+
+    @staticmethod
+    def _latest_version(conn, design_id):
+        """Newest version number of a design; 0 if it was stored before history was kept"""
+        return conn.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM design_versions WHERE design_id = ?", (design_id,)
+        ).fetchone()[0]
+
+    def _commit(self, pending):
+        """Queue a write and return once a group commit has made it durable"""
+        with self._queue_changed:
+            self._queue.append(pending)
+            while self._committing and not pending.done:
+                self._queue_changed.wait()
+            if not pending.done:
+                # Leader: commit everything queued while the previous commit was syncing
+                self._committing = True
+                batch, self._queue = self._queue, []
+        if not pending.done:
+            error = None
+            try:
+                with self._lock, self._conn:
+                    for write in batch:
+                        if write.patch is None:
+                            self._record_version(write)
+                            self._write(write.row)
+                            continue
+                        try:
+                            self._patch(write)
+                        except (InvalidPatch, VersionConflict) as e:
+                            write.error = e  # rejected before writing anything; the batch goes on
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                if self.cache is not None:
+                    # Before any of these saves returns, so no later read can see the old design
+                    for write in batch:
+                        self.cache.invalidate(("design", write.row["id"] if write.patch is None else write.patch[0]))
+                # Always hand over, or the saves queued behind this batch would wait forever
+                with self._queue_changed:
+                    if error is None:
+                        self.commits += 1
+                        self.committed_rows += len(batch)
+                    for write in batch:
+                        if error is not None:
+                            write.error = error
+                        write.done = True
+                    self._committing = False
+                    self._queue_changed.notify_all()
+        if pending.error is not None:
+            raise pending.error
+        return pending.version
+
+    def put(self, design):
+        """Insert or replace a whole design dict as its next version
+
+        Returns the version number once it is durably committed.
+        """
+        return self._commit(_PendingWrite(design, design_row(design)))
+
+    def patch(self, design_id, base_version, ops, fields=None, updated_at=None):
+        """Apply brick ops (see parse_patch) and field changes to the stored design
+
+        Returns the new version number and the patched design (without its bricks when they stay
+        packed) once it is durably committed, or (None, None) if the design does not exist. Raises
+        VersionConflict unless base_version is still the latest version, and InvalidPatch for ops
+        that do not fit it.
+        """
+        fields = {k: v for k, v in (fields or {}).items() if k in PATCH_FIELDS}
+        patch = (design_id, base_version, ops, fields, updated_at or time.time())
+        pending = _PendingWrite(None, None, patch)
+        version = self._commit(pending)
+        return version, pending.design
+
+    def _read(self, design_id):
+        """The stored design dict and its estimated decoded size, or (None, 0)"""
+        row = self._reader().execute("SELECT payload, bricks FROM designs WHERE id = ?", (design_id,)).fetchone()
+        if row is None:
+            return None, 0
+        design = json.loads(row["payload"])
+        unpacked = 0
+        if row["bricks"] is not None:
+            design["bricks"] = brick_codec.decode_bricks(row["bricks"]).to_dicts()
+            unpacked = len(design["bricks"])
+        return design, estimate_bytes(len(row["payload"]), unpacked)
+
+    def get(self, design_id):
+        """The stored design dict, or None; always a fresh copy the caller may modify"""
+        return self._read(design_id)[0]
+
+    def get_versioned(self, design_id):
+        """The stored design dict and its version, read together, or (None, None)
+
+        Served from the cache when there is one, so the design must be treated as read-only.
+        """
+        key = ("design", design_id)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            generation = self.cache.generation()
+        conn = self._reader()
+        conn.execute("BEGIN")  # one snapshot, so a save landing in between cannot split the pair
+        try:
+            design, size = self._read(design_id)
+            version = self._latest_version(conn, design_id) if design is not None else None
+        finally:
+            conn.commit()
+        if design is None:
+            return None, None
+        if self.cache is not None:
+            self.cache.put(key, (design, version), size, generation)
+        return design, version
+
+    def revision(self, design_id):
+        """(version, updated_at) of a stored design from its indexes alone, or None"""
+        row = self._reader().execute(
+            "SELECT COALESCE((SELECT MAX(version) FROM design_versions WHERE design_id = ?), 0), updated_at "
+            "FROM designs WHERE id = ?",
+            (design_id, design_id),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def summary(self, design_id):
+        """Listing entry of one design without touching its payload, or None"""
+        row = self._reader().execute(f"SELECT {SUMMARY_COLUMNS} FROM designs WHERE id = ?", (design_id,)).fetchone()
+        return row_summary(row) if row else None
+
+    def delete(self, design_id):
+        """Remove a design and its history; False if it did not exist"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM design_versions WHERE design_id = ?", (design_id,))
+            deleted = self._conn.execute("DELETE FROM designs WHERE id = ?", (design_id,)).rowcount > 0
+        if self.cache is not None:
+            self.cache.invalidate(("design", design_id))
+        return deleted
+
+    def versions(self, design_id):
+        """Metadata of every saved version of a design, newest first, without reading any payload"""
+        rows = self._reader().execute(
+            f"SELECT {VERSION_COLUMNS} FROM design_versions WHERE design_id = ? ORDER BY version DESC",
+            (design_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def version(self, design_id, version):
+        """The design dict as saved at a version, or None
+
+        Reads the nearest snapshot at or before the version and replays the deltas after it, so
+        the cost is one snapshot plus at most SNAPSHOT_INTERVAL small deltas.
+        """
+        conn = self._reader()
+        start = conn.execute(
+            "SELECT version FROM design_versions WHERE design_id = ? AND version <= ? AND kind = 'snapshot' "
+            "ORDER BY version DESC LIMIT 1",
+            (design_id, version),
+        ).fetchone()
+        if start is None:
+            return None
+        # Versions are never rewritten, so this second read cannot disagree with the first
+        rows = conn.execute(
+            "SELECT version, encoding, meta, data FROM design_versions "
+            "WHERE design_id = ? AND version BETWEEN ? AND ? ORDER BY version",
+            (design_id, start["version"], version),
+        ).fetchall()
+        if not rows or rows[-1]["version"] != version:
+            return None
+        snapshot, target = rows[0], rows[-1]
+        design = design_history.unpack(target["meta"])
+        encoding = snapshot["encoding"]
+        if len(rows) == 1 and encoding == design_history.ITEMS:
+            design["bricks"] = design_history.unpack(snapshot["data"])
+            return design
+        elements = design_history.unpack_snapshot(snapshot["data"], encoding)
+        for row in rows[1:]:
+            elements = design_history.apply(elements, design_history.unpack(row["data"]), encoding)
+        design["bricks"] = design_history.to_bricks(elements, encoding)
+        return design
+
+    def count(self, mode=None):
+        if mode is None:
+            return self._reader().execute("SELECT COUNT(*) FROM designs").fetchone()[0]
+        return self._reader().execute("SELECT COUNT(*) FROM designs WHERE mode = ?", (mode,)).fetchone()[0]
+
+    def summaries(self):
+        """Summaries of every stored design, in no particular order"""
+        rows = self._reader().execute(f"SELECT {SUMMARY_COLUMNS} FROM designs").fetchall()
+        return [row_summary(r) for r in rows]
+
+    def list(self, sort="created_at", order="desc", limit=DEFAULT_PAGE_SIZE, cursor=None,
+             mode=None, tag=None, category=None):
+        """One page of design summaries and the cursor of the next page (None on the last page)
+
+        Pages are keyset-paginated on (sort column, id), so a page costs the same however deep
+        it is and designs saved meanwhile never shift or repeat entries.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown order: {order}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        where, params = [], []
+        if mode is not None:
+            where.append("mode = ?")
+            params.append(mode)
+        for kind, label in (("tag", tag), ("category", category)):
+            if label is not None:
+                where.append("id IN (SELECT design_id FROM design_labels WHERE kind = ? AND label = ?)")
+                params += [kind, label]
+        if cursor:
+            where.append(f"({sort}, id) {'<' if order == 'desc' else '>'} (?, ?)")
+            params += decode_cursor(cursor)
+
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM designs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort} {order}, id {order} LIMIT ?"
+        rows = self._reader().execute(sql, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][sort], rows[-1]["id"])
+        return [row_summary(r) for r in rows], next_cursor
+
+    def migrate_json(self, directory):
+        """One-shot import of the per-design JSON files in directory; later calls do nothing
+
+        Shared designs (shared_*.json) are not saved designs and stay where they are. The JSON
+        files are left in place as a backup. Returns the number of designs imported.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+        rows = []
+        for f in sorted(Path(directory).glob("*.json")):
+            if f.name.startswith("shared_"):
+                continue
+            try:
+                with open(f) as fh:
+                    rows.append(design_row(json.load(fh)))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Warning: skipping unreadable design {f.name}: {e}")
+        with self._lock, self._conn:
+            existing = {r[0] for r in self._conn.execute("SELECT id FROM designs")}
+            for row in rows:
+                if row["id"] not in existing:
+                    self._write(row)
+            self._conn.execute("INSERT INTO store_meta VALUES ('json_migrated', ?)", (str(time.time()),))
+        return sum(1 for row in rows if row["id"] not in existing)
@@ -0,0 +1,131 @@
+"""
+Export Cache — Content-addressed cache of exported files
+Exports are keyed by a hash of the canonical brick list, format and options; files live in
+EXPORTS_DIR and are evicted least-recently-used once their total size exceeds a byte budget
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+INDEX_FILENAME = ".export_cache.json"
+
+
+def _number(value):
+    """Collapse 1, 1.0 and "1" style numbers to one canonical JSON value"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(value) if value.is_integer() else value
+
+
+def canonical_bricks(bricks):
+    """Order-independent canonical form of a brick list (defaults applied, extra keys ignored)"""
+    return sorted(
+        (
+            str(b.get("type", "2x4")),
+            _number(b.get("x", 0)), _number(b.get("y", 0)), _number(b.get("z", 0)),
+            str(b.get("color", "red")),
+            _number(b.get("rotation", 0)),
+        )
+        for b in bricks
+    )
+
+
+def canonical_shapes(shapes):
+    return sorted(json.dumps(s, sort_keys=True, default=str) for s in shapes)
+
+
+def design_hash(fmt, bricks, shapes=(), options=None):
+    """Content address of an export: hex digest of format, options and canonical geometry"""
+    payload = json.dumps(
+        [fmt, options or {}, canonical_bricks(bricks), canonical_shapes(shapes)],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+class ExportCache:
+    """Thread-safe LRU index of exported files, bounded by total bytes on disk"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> {"filename", "size", "result"}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        index = self.directory / INDEX_FILENAME
+        if not index.exists():
+            return
+        try:
+            with open(index) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in entries:
+            if (self.directory / entry["filename"]).exists():
+                self._entries[key] = entry
+
+    def _save(self):
+        index = self.directory / INDEX_FILENAME
+        tmp = index.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(list(self._entries.items()), f)
+        tmp.replace(index)
+
+    @property
+    def total_bytes(self):
+        return sum(e["size"] for e in self._entries.values())
+
+    def get(self, key):
+        """Cached export result for a key, or None; refreshes its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not (self.directory / entry["filename"]).exists():
+                # File removed behind our back
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return dict(entry["result"])
+
+    def put(self, key, filename, result):
+        """Record a freshly written export and evict old ones past the byte budget"""
+        size = (self.directory / filename).stat().st_size
+        with self._lock:
+            self._entries[key] = {"filename": filename, "size": size, "result": result}
+            self._entries.move_to_end(key)
+            total = self.total_bytes
+            while total > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                (self.directory / old["filename"]).unlink(missing_ok=True)
+                total -= old["size"]
+                self.evictions += 1
+            self._save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,194 @@
+"""
+Export Jobs — Background export queue with progress, ETA and cancellation
+CPU-heavy exports run on a bounded worker pool instead of inside the async request handlers
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class ExportJob:
+    """One export request; workers call report() to publish progress and honour cancellation"""
+
+    def __init__(self, kind, meta=None, key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.meta = meta or {}
+        self.status = "queued"
+        self.progress = 0.0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.version = 0  # bumped on every change, for SSE
+        self.subscribers = 1  # requesters handed this job that have not cancelled it
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, done, total):
+        """Progress callback for exporters; raises ExportCancelled once the job is cancelled"""
+        if self._cancel.is_set():
+            raise ExportCancelled()
+        self.progress = min(1.0, done / total) if total else 1.0
+        self.version += 1
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = ((self.finished_at or now) - self.started_at) if self.started_at else 0.0
+        eta = None
+        if self.status == "running" and self.progress > 0:
+            eta = round(elapsed * (1 - self.progress) / self.progress, 1)
+        snap = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "percent": round(self.progress * 100, 1),
+            "elapsed_seconds": round(elapsed, 2),
+            "eta_seconds": eta,
+            "status_url": f"/api/export/jobs/{self.id}",
+            "events_url": f"/api/export/jobs/{self.id}/events",
+            **self.meta,
+        }
+        if self.result is not None:
+            snap["result"] = self.result
+            snap["download_url"] = self.result.get("download_url")
+        if self.error:
+            snap["error"] = self.error
+        return snap
+
+
+class ExportJobQueue:
+    """Bounded thread pool of export workers plus a registry of recent jobs"""
+
+    def __init__(self, max_workers, max_pending=32, max_kept=256):
+        self.max_pending = max_pending
+        self.max_kept = max_kept
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._jobs = OrderedDict()
+        self._active = {}  # key -> queued or running job with that key
+        self._lock = threading.Lock()
+
+    def _register_locked(self, job):
+        self._jobs[job.id] = job
+        # Forget the oldest finished jobs
+        finished = [j.id for j in self._jobs.values() if j.status in TERMINAL_STATES]
+        for old_id in finished[:max(0, len(self._jobs) - self.max_kept)]:
+            del self._jobs[old_id]
+
+    def _register(self, job):
+        with self._lock:
+            self._register_locked(job)
+
+    def _pending_locked(self):
+        return sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+
+    def pending(self):
+        with self._lock:
+            return self._pending_locked()
+
+    def submit(self, kind, fn, *args, meta=None, key=None):
+        """Queue fn(report, *args) on the worker pool; returns the job
+
+        A job submitted with the key of one still queued or running gets that job back instead, as
+        one more subscriber.
+        """
+        with self._lock:
+            running = self._active.get(key) if key is not None else None
+            if running is not None and running.status not in TERMINAL_STATES and not running.cancelled:
+                running.subscribers += 1
+                return running
+            # Checked and registered under one lock, so concurrent submits cannot overshoot the bound
+            if self._pending_locked() >= self.max_pending:
+                raise QueueFull(f"Export queue is full ({self.max_pending} jobs pending)")
+            job = ExportJob(kind, meta, key)
+            self._register_locked(job)
+            if key is not None:
+                self._active[key] = job
+        job.future = self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def completed(self, kind, result, meta=None):
+        """Register an already-finished job (e.g. an export cache hit)"""
+        job = ExportJob(kind, meta)
+        job.status = "done"
+        job.progress = 1.0
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        self._register(job)
+        return job
+
+    def _finish_cancelled(self, job):
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        job.version += 1
+        self._release(job)
+
+    def _run(self, job, fn, args):
+        if job.cancelled:
+            # Cancelled after its worker picked it up but before it started
+            self._finish_cancelled(job)
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        job.version += 1
+        try:
+            job.result = fn(job.report, *args)
+            job.progress = 1.0
+            job.status = "done"
+        except ExportCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.version += 1
+            self._release(job)
+
+    def _release(self, job):
+        with self._lock:
+            if job.key is not None and self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Withdraw one subscriber from a queued or running job; returns the job or None
+
+        The job itself is only cancelled once every requester it was handed to has withdrawn.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return job
+            job.subscribers = max(0, job.subscribers - 1)
+            if job.subscribers:
+                return job
+            job._cancel.set()
+            never_started = job.future is not None and job.future.cancel()
+            if not never_started:
+                job.version += 1
+        if never_started:
+            self._finish_cancelled(job)
+        return job
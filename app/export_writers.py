@@ -0,0 +1,419 @@
+"""
+Export Writers — Streaming serializers for exported meshes
+Binary STL is written header-first, then as fixed-size chunks of 50-byte triangle records;
+3MF is zipped on the fly, so either format can go to disk or straight into an HTTP response
+"""
+
+import os
+import struct
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+
+# ========== BINARY STL ==========
+
+# One binary STL facet: normal, 3 vertices, attribute byte count (50 bytes, little-endian)
+STL_RECORD = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+STL_CHUNK_TRIANGLES = 65536
+
+
+def stl_header(name, triangle_count):
+    """80-byte header plus uint32 triangle count"""
+    # Must not start with "solid", or some readers mistake the file for ASCII STL
+    title = f"3D Designer binary STL: {name}".encode("utf-8", "replace")[:80]
+    return title.ljust(80, b" ") + np.uint32(triangle_count).tobytes()
+
+
+def stl_size(triangle_count):
+    """Exact byte size of a binary STL with this many triangles"""
+    return 84 + STL_RECORD.itemsize * triangle_count
+
+
+def fill_stl_records(records, tris):
+    """Write a (n, 3, 3) triangle array with unit normals into an STL_RECORD array in place"""
+    records["vertices"] = tris
+    records["attr"] = 0
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    return records
+
+
+def stl_records(tris):
+    """Pack a (n, 3, 3) triangle array into binary STL records with unit normals"""
+    return fill_stl_records(np.zeros(len(tris), dtype=STL_RECORD), tris).tobytes()
+
+
+def iter_binary_stl(name, triangle_count, batches, chunk_triangles=STL_CHUNK_TRIANGLES, progress=None):
+    """Yield a binary STL as bytes: header first, then records in fixed-size chunks
+
+    batches is any iterable of (n, 3, 3) float arrays or already packed STL_RECORD arrays; the
+    total must match triangle_count.
+    progress, if given, is called as progress(triangles_written, triangle_count) after each chunk.
+    """
+    yield stl_header(name, triangle_count)
+    written = 0
+    for tris in batches:
+        for start in range(0, len(tris), chunk_triangles):
+            chunk = tris[start:start + chunk_triangles]
+            written += len(chunk)
+            if written > triangle_count:
+                raise ValueError(f"STL stream produced more than the declared {triangle_count} triangles")
+            yield chunk.tobytes() if chunk.dtype == STL_RECORD else stl_records(chunk)
+            if progress:
+                progress(written, triangle_count)
+    if written != triangle_count:
+        raise ValueError(f"STL stream produced {written} of {triangle_count} declared triangles")
+
+
+def write_stream(path, chunks):
+    """Write an iterable of byte chunks to path; returns bytes written
+
+    Chunks go to a temp file of this call's own, renamed over path only once complete, so
+    concurrent writers of one path never see or delete each other's output.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:12]}.tmp")
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        # Never leave a truncated export behind in the exports folder
+        tmp.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def write_binary_stl(path, name, triangle_count, batches, chunk_triangles=STL_CHUNK_TRIANGLES, progress=None):
+    """Stream a binary STL to disk; returns bytes written"""
+    return write_stream(path, iter_binary_stl(name, triangle_count, batches, chunk_triangles, progress))
+
+
+# ========== ZIP STREAMING ==========
+
+# Speed/size profiles for zip-based exports: compression method and zlib level. "store" is deflate
+# level 0 (stored deflate blocks): a STORED entry cannot be followed by a data descriptor, since
+# streaming readers have no way to find where its data ends
+ZIP_PROFILES = {
+    "store": {"method": zipfile.ZIP_DEFLATED, "level": 0},
+    "fast": {"method": zipfile.ZIP_DEFLATED, "level": 1},
+    "standard": {"method": zipfile.ZIP_DEFLATED, "level": 6},
+    "max": {"method": zipfile.ZIP_DEFLATED, "level": 9},
+}
+DEFAULT_ZIP_PROFILE = "standard"
+
+# Entries are deflated as independent blocks, several at once; each block is primed with the tail
+# of the one before it (as pigz does), so the ratio stays close to a single-threaded deflate
+ZIP_BLOCK_BYTES = 4 * 1024 * 1024
+ZIP_DICT_BYTES = 32 * 1024
+
+# Without zip64 every size and offset has to fit in 32 bits
+ZIP_LIMIT = 0xFFFFFFFF
+
+# Local header flags: sizes and CRC follow the data in a descriptor; bit 11 marks UTF-8 names
+ZIP_DATA_DESCRIPTOR = 0x08
+ZIP_UTF8 = 0x800
+
+
+def deflate_block(data, level, zdict=b"", last=False):
+    """Raw DEFLATE of one block of an entry
+
+    Blocks other than the last end on a byte-aligned sync flush, so the compressed blocks of an
+    entry concatenate into one valid DEFLATE stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, **({"zdict": zdict} if zdict else {}))
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def iter_blocks(chunks, size=ZIP_BLOCK_BYTES):
+    """Regroup byte chunks into blocks of size bytes; the final block is shorter, possibly empty"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    yield bytes(buffer)
+
+
+def _timed_deflate(data, level, zdict, last):
+    started = time.perf_counter()
+    deflated = deflate_block(data, level, zdict, last)
+    return deflated, time.perf_counter() - started
+
+
+def iter_deflated(blocks, level, pool, window):
+    """Yield (block, deflated block, seconds spent deflating it) in order, with up to window blocks
+    compressing at once"""
+    pending = deque()
+    blocks = iter(blocks)
+    block, tail = next(blocks), b""
+    for following in chain(blocks, [None]):
+        pending.append((block, pool.submit(_timed_deflate, block, level, tail, following is None)))
+        tail = block[-ZIP_DICT_BYTES:]
+        block = following
+        if len(pending) >= window:
+            done, future = pending.popleft()
+            yield (done, *future.result())
+    while pending:
+        done, future = pending.popleft()
+        yield (done, *future.result())
+
+
+def _dos_datetime(t):
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def iter_zip(entries, profile=DEFAULT_ZIP_PROFILE, workers=None, stats=None):
+    """Yield a ZIP archive front to back as bytes; entries is an iterable of (name, iterable of bytes chunks)
+
+    Headers are never patched afterwards: each entry's CRC and sizes follow its data in a data
+    descriptor. stats, if given, is a dict filled with the profile, byte counts, compression ratio
+    and the seconds spent inside the compressor, summed over workers.
+    """
+    method, level = ZIP_PROFILES[profile]["method"], ZIP_PROFILES[profile]["level"]
+    workers = max(1, workers or os.cpu_count() or 1)
+    stats = {} if stats is None else stats
+    stats.update(profile=profile, uncompressed_bytes=0, compressed_bytes=0, ratio=None, seconds=0.0)
+    dos_time, dos_date = _dos_datetime(time.localtime())
+    offset, directory = 0, []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, chunks in entries:
+            encoded = name.encode("utf-8")
+            flags = ZIP_DATA_DESCRIPTOR | (0 if encoded.isascii() else ZIP_UTF8)
+            header = struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, flags, method, dos_time, dos_date,
+                                 0, 0, 0, len(encoded), 0) + encoded
+            entry_offset = offset
+            offset += len(header)
+            yield header
+
+            crc = size = packed_size = 0
+            for block, deflated, seconds in iter_deflated(iter_blocks(chunks), level, pool, 2 * workers):
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                packed_size += len(deflated)
+                stats["seconds"] += seconds
+                if deflated:
+                    yield deflated
+            if max(size, packed_size, offset + packed_size) > ZIP_LIMIT:
+                raise ValueError(f"ZIP entry {name} is too large for a non-zip64 archive")
+
+            descriptor = struct.pack("<IIII", 0x08074B50, crc, packed_size, size)
+            offset += packed_size + len(descriptor)
+            yield descriptor
+            directory.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 20, 20, flags, method, dos_time, dos_date,
+                crc, packed_size, size, len(encoded), 0, 0, 0, 0, 0o600 << 16, entry_offset) + encoded)
+            stats["uncompressed_bytes"] += size
+            stats["compressed_bytes"] += packed_size
+
+    central = b"".join(directory)
+    yield central + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(directory), len(directory),
+                                len(central), offset, 0)
+    if stats["compressed_bytes"]:
+        stats["ratio"] = round(stats["uncompressed_bytes"] / stats["compressed_bytes"], 2)
+    stats["seconds"] = round(stats["seconds"], 3)
+
+
+# ========== 3MF ==========
+
+THREEMF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">\n'
+    '  <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml" />\n'
+    '  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />\n'
+    '  <Default Extension="config" ContentType="text/xml" />\n'
+    '</Types>'
+)
+
+THREEMF_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">\n'
+    '  <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel" />\n'
+    '</Relationships>'
+)
+
+THREEMF_ROWS_PER_CHUNK = 16384
+
+# Row templates. 7 significant digits is deliberately lossy: exact float32 needs 9, but 7 keeps
+# values like 12.8 short (not 12.8000002) and still resolves 0.0001 mm on anything under 1 m
+THREEMF_VERTEX_ROW = '          <vertex x="%.7g" y="%.7g" z="%.7g" />\n'
+THREEMF_TRIANGLE_ROW = '          <triangle v1="%d" v2="%d" v3="%d" />\n'
+
+
+def format_rows(template, rows):
+    """Encoded text of a (n, k) array, formatted in one C-level % pass over a repeated row template"""
+    if not len(rows):
+        return b""
+    return ((template * len(rows)) % tuple(rows.ravel().tolist())).encode()
+
+
+THREEMF_MODEL_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+    '  <resources>\n'
+)
+
+# Resource id of the <basematerials> group; objects are numbered after it
+THREEMF_MATERIALS_ID = 1
+
+
+def threemf_first_object_id(materials):
+    return THREEMF_MATERIALS_ID + 1 if materials else 1
+
+
+def threemf_materials(materials):
+    """<basematerials> resource for (name, "#RRGGBB") colors; an object's pindex is its color's position"""
+    bases = "".join(f'      <base name={quoteattr(str(name))} displaycolor="{hex_color.upper()}" />\n'
+                    for name, hex_color in materials)
+    return f'    <basematerials id="{THREEMF_MATERIALS_ID}">\n{bases}    </basematerials>\n'.encode()
+
+
+def iter_3mf_object(object_id, vertices, triangles, progress=None, rows=THREEMF_ROWS_PER_CHUNK, material=None):
+    """Yield one mesh <object> as encoded chunks of rows; progress(rows_written) after each chunk
+
+    material, if given, is the object's pindex into the <basematerials> group.
+    """
+    paint = "" if material is None else f' pid="{THREEMF_MATERIALS_ID}" pindex="{material}"'
+    yield f'    <object id="{object_id}" type="model"{paint}>\n      <mesh>\n        <vertices>\n'.encode()
+    for start in range(0, len(vertices), rows):
+        yield format_rows(THREEMF_VERTEX_ROW, vertices[start:start + rows])
+        if progress:
+            progress(min(start + rows, len(vertices)))
+    yield b'        </vertices>\n        <triangles>\n'
+    for start in range(0, len(triangles), rows):
+        yield format_rows(THREEMF_TRIANGLE_ROW, triangles[start:start + rows])
+        if progress:
+            progress(len(vertices) + min(start + rows, len(triangles)))
+    yield b'        </triangles>\n      </mesh>\n    </object>\n'
+
+
+def threemf_build(object_ids):
+    """Closing </resources> plus the <build> section placing each object once"""
+    items = "".join(f'    <item objectid="{i}" />\n' for i in object_ids)
+    return (f'  </resources>\n  <build>\n{items}  </build>\n</model>').encode()
+
+
+def iter_3mf_model(objects, materials=(), progress=None, rows=THREEMF_ROWS_PER_CHUNK):
+    """Yield the 3D/3dmodel.model XML of mesh objects as encoded chunks of rows
+
+    objects is a list of (vertices, triangles, material index or None), each placed once by the
+    build; materials is a list of (name, "#RRGGBB") written as one <basematerials> group.
+    progress, if given, is called as progress(rows_written, total_rows).
+    """
+    total = sum(len(v) + len(t) for v, t, _ in objects)
+    first_id = threemf_first_object_id(materials)
+    done = 0
+    yield THREEMF_MODEL_HEADER.encode()
+    if materials:
+        yield threemf_materials(materials)
+    for object_id, (verts, tris, material) in enumerate(objects, start=first_id):
+        report = progress and (lambda n, base=done: progress(base + n, total))
+        yield from iter_3mf_object(object_id, verts, tris, report, rows, material)
+        done += len(verts) + len(tris)
+    yield threemf_build(range(first_id, first_id + len(objects)))
+
+
+# Component placement; the 3x3 part stays identity since bricks are only translated
+THREEMF_COMPONENT_ROW = '        <component objectid="%d" transform="1 0 0 0 1 0 0 0 1 %.7g %.7g %.7g" />\n'
+
+
+def iter_3mf_instanced_model(parts, materials=(), progress=None, rows=THREEMF_ROWS_PER_CHUNK):
+    """Yield 3D/3dmodel.model XML with one mesh object per template and one components object
+
+    parts is a list of (vertices, faces, origins, material index or None): each template mesh is
+    written once and placed at every (n, 3) origin by a translation-only <component>, so size
+    follows distinct templates. progress, if given, is called as progress(rows_written, total_rows).
+    """
+    total = sum(len(v) + len(f) + len(o) for v, f, o, _ in parts)
+    first_id = threemf_first_object_id(materials)
+    done = 0
+    yield THREEMF_MODEL_HEADER.encode()
+    if materials:
+        yield threemf_materials(materials)
+    for object_id, (verts, faces, _, material) in enumerate(parts, start=first_id):
+        report = progress and (lambda n, base=done: progress(base + n, total))
+        yield from iter_3mf_object(object_id, verts, faces, report, rows, material)
+        done += len(verts) + len(faces)
+
+    assembly_id = first_id + len(parts)
+    yield f'    <object id="{assembly_id}" type="model">\n      <components>\n'.encode()
+    for object_id, (_, _, origins, _) in enumerate(parts, start=first_id):
+        for start in range(0, len(origins), rows):
+            block = origins[start:start + rows]
+            placed = np.empty((len(block), 4), dtype=np.float64)
+            placed[:, 0] = object_id
+            placed[:, 1:] = block
+            yield format_rows(THREEMF_COMPONENT_ROW, placed)
+            done += len(block)
+            if progress:
+                progress(done, total)
+    yield b'      </components>\n    </object>\n'
+    yield threemf_build([assembly_id])
+
+
+# Bambu Studio / OrcaSlicer per-object and per-plate settings
+THREEMF_PLATE_SETTINGS = "Metadata/model_settings.config"
+
+
+def threemf_plate_settings(names, plates, materials_used, materials=()):
+    """model_settings.config naming each object of iter_3mf_model and assigning it to a plate
+
+    names, plates and materials_used run parallel to the objects; a painted object also gets the
+    extruder (AMS slot) matching its material.
+    """
+    first_id = threemf_first_object_id(materials)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<config>"]
+    for object_id, (name, material) in enumerate(zip(names, materials_used), start=first_id):
+        lines.append(f'  <object id="{object_id}">')
+        lines.append(f'    <metadata key="name" value={quoteattr(str(name))}/>')
+        if material is not None:
+            lines.append(f'    <metadata key="extruder" value="{material + 1}"/>')
+        lines.append("  </object>")
+    for plate in sorted(set(plates)):
+        lines += ["  <plate>", f'    <metadata key="plater_id" value="{plate}"/>', '    <metadata key="locked" value="false"/>']
+        for object_id, object_plate in enumerate(plates, start=first_id):
+            if object_plate == plate:
+                lines += ["    <model_instance>", f'      <metadata key="object_id" value="{object_id}"/>',
+                          '      <metadata key="instance_id" value="0"/>', "    </model_instance>"]
+        lines.append("  </plate>")
+    lines.append("</config>")
+    return "\n".join(lines).encode()
+
+
+def iter_3mf_package(model_chunks, extra=(), profile=DEFAULT_ZIP_PROFILE, stats=None):
+    """Yield a complete 3MF package (ZIP) around an iterable of 3D/3dmodel.model chunks
+
+    extra is any further (name, iterable of bytes chunks) entries, e.g. plate settings; profile
+    and stats are passed on to iter_zip.
+    """
+    return iter_zip([
+        ("[Content_Types].xml", [THREEMF_CONTENT_TYPES.encode()]),
+        ("_rels/.rels", [THREEMF_RELS.encode()]),
+        ("3D/3dmodel.model", model_chunks),
+        *extra,
+    ], profile, stats=stats)
+
+
+def iter_3mf(vertices, triangles, progress=None):
+    """Yield a complete 3MF package (ZIP) of one mesh object as bytes"""
+    return iter_3mf_package(iter_3mf_model([(vertices, triangles, None)], progress=progress))
@@ -0,0 +1,162 @@
+"""
+Geometry Library — Precompiled unit meshes for every brick type and custom shape primitive
+All templates are tessellated once per quality profile and packed into a single uncompressed .npz
+whose members are memory-mapped, so export workers share one copy through the page cache
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+try:
+    from app.mesh_engine import PRIMITIVE_TYPES, QUALITY_PROFILES, primitive_mesh
+except ImportError:
+    from mesh_engine import PRIMITIVE_TYPES, QUALITY_PROFILES, primitive_mesh
+
+# Bump when template construction changes so stale library files are rebuilt
+LIBRARY_VERSION = 3
+LIBRARY_FILENAME = ".geometry_library.npz"
+
+
+def brick_key(brick_type, quality, studded):
+    return f"brick/{brick_type}/{quality}/{int(bool(studded))}"
+
+
+def primitive_key(kind, quality):
+    return f"shape/{kind}/{quality}"
+
+
+def library_fingerprint(mesher, primitives=PRIMITIVE_TYPES):
+    """Hash of everything the templates are built from: brick table, dimensions and profiles"""
+    payload = json.dumps([
+        LIBRARY_VERSION, mesher.brick_library, mesher.unit_mm, mesher.height_mm,
+        mesher.stud_radius, mesher.stud_height, QUALITY_PROFILES, sorted(primitives),
+    ], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+# ========== BUILD ==========
+
+def build_library(mesher, primitives=PRIMITIVE_TYPES):
+    """Tessellate every template into packed arrays: keys, spans (v0, v1, f0, f1), vertices, faces"""
+    keys, meshes = [], []
+    for quality, profile in QUALITY_PROFILES.items():
+        for brick_type, info in mesher.brick_library.items():
+            for studded in (True, False):
+                keys.append(brick_key(brick_type, quality, studded))
+                meshes.append(mesher.build_template(info, profile, studded))
+        for kind in primitives:
+            keys.append(primitive_key(kind, quality))
+            meshes.append(primitive_mesh(kind, quality))
+
+    n_verts = np.array([len(v) for v, _ in meshes], dtype=np.int64)
+    n_faces = np.array([len(f) for _, f in meshes], dtype=np.int64)
+    v_starts = np.concatenate([[0], np.cumsum(n_verts)])
+    f_starts = np.concatenate([[0], np.cumsum(n_faces)])
+    return {
+        "fingerprint": np.array(library_fingerprint(mesher, primitives)),
+        "keys": np.array(keys),
+        "spans": np.stack([v_starts[:-1], v_starts[1:], f_starts[:-1], f_starts[1:]], axis=1),
+        "vertices": np.concatenate([v for v, _ in meshes]).astype(np.float32).reshape(-1, 3),
+        "faces": np.concatenate([f for _, f in meshes]).astype(np.int32).reshape(-1, 3),
+    }
+
+
+def save_library(path, arrays):
+    """Write the library atomically (uncompressed, so every member can be memory-mapped)"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def mmap_npz(path):
+    """Read-only memory maps of every member of an uncompressed .npz"""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {info.filename} is compressed and cannot be memory-mapped")
+            # Local file header: 30 fixed bytes, then the name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran, dtype = read_header(f)
+            size = int(np.prod(shape))
+            if not shape or not size:
+                # Scalars and empty arrays are read directly; np.memmap needs at least one element
+                arrays[info.filename[:-4]] = np.fromfile(f, dtype=dtype, count=size).reshape(shape)
+                continue
+            arrays[info.filename[:-4]] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                                   order="F" if fortran else "C")
+    return arrays
+
+
+# ========== LIBRARY ==========
+
+class GeometryLibrary:
+    """Memory-mapped template store; pickles as its path so process workers map the same file"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._open()
+
+    def _open(self):
+        arrays = mmap_npz(self.path)
+        self.fingerprint = str(arrays["fingerprint"][()])
+        self.vertices = arrays["vertices"]
+        self.faces = arrays["faces"]
+        self._spans = {str(key): tuple(int(x) for x in span) for key, span in zip(arrays["keys"], arrays["spans"])}
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def get(self, key):
+        """(vertices, faces) views of one template, or None when the library doesn't have it"""
+        span = self._spans.get(key)
+        if span is None:
+            return None
+        v0, v1, f0, f1 = span
+        return self.vertices[v0:v1], self.faces[f0:f1]
+
+    def brick(self, brick_type, quality, studded=True):
+        return self.get(brick_key(brick_type, quality, studded))
+
+    def primitive(self, kind, quality):
+        return self.get(primitive_key(kind, quality))
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "templates": len(self),
+            "vertices": len(self.vertices),
+            "faces": len(self.faces),
+            "bytes": os.path.getsize(self.path),
+        }
+
+
+def load_library(path, mesher, primitives=PRIMITIVE_TYPES):
+    """Map the library at path, rebuilding it first if it is missing or built from other inputs"""
+    expected = library_fingerprint(mesher, primitives)
+    if os.path.exists(path):
+        try:
+            library = GeometryLibrary(path)
+            if library.fingerprint == expected:
+                return library
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass
+    save_library(path, build_library(mesher, primitives))
+    return GeometryLibrary(path)
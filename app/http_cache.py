@@ -0,0 +1,72 @@
+"""
+HTTP Cache — ETag validators and 304 answers for JSON routes
+Static catalogs render their body once and keep its hash as a strong ETag; stored documents derive
+theirs from a version, so If-None-Match is answered before anything is read or encoded
+"""
+
+import hashlib
+import threading
+
+from fastapi.responses import JSONResponse, Response
+
+# Catalogs only change with a deploy: browsers may reuse them briefly, then revalidate
+STATIC_CACHE_CONTROL = "public, max-age=300"
+
+# Saved designs change under the same URL: always revalidate, and keep them out of shared caches
+DOCUMENT_CACHE_CONTROL = "private, no-cache"
+
+# Shared designs never change once written
+IMMUTABLE_CACHE_CONTROL = "public, max-age=86400, immutable"
+
+
+def make_etag(*parts):
+    """Strong ETag of bytes, or of the string forms of the given parts"""
+    data = parts[0] if len(parts) == 1 and isinstance(parts[0], bytes) else "\0".join(map(str, parts)).encode()
+    return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+def not_modified(request, etag):
+    """Whether the request's If-None-Match already names etag (weak comparison, per RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified_response(etag, cache_control):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def json_response(content, etag, cache_control, status_code=200):
+    """JSONResponse carrying the validator headers"""
+    return JSONResponse(content, status_code=status_code, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+class CachedJSON:
+    """A JSON body built and encoded once, then served with its hash as a strong ETag"""
+
+    def __init__(self, build, cache_control=STATIC_CACHE_CONTROL):
+        self._build = build
+        self._cache_control = cache_control
+        self._lock = threading.Lock()
+        self._body = None
+        self._etag = None
+
+    def _render(self):
+        with self._lock:
+            if self._body is None:
+                body = JSONResponse(self._build()).body
+                self._etag = make_etag(body)
+                self._body = body
+        return self._body, self._etag
+
+    def response(self, request):
+        body, etag = self._body, self._etag
+        if body is None:
+            body, etag = self._render()
+        if not_modified(request, etag):
+            return not_modified_response(etag, self._cache_control)
+        return Response(body, media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": self._cache_control})
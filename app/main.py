@@ -5,14 +5,20 @@ Supports: LEGO brick building, 3D modeling, STL/3MF export for Bambu Lab printer
 """
 
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+import io
 import os
 import json
+import asyncio
+import functools
+import hashlib
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # App setup
@@ -31,11 +37,33 @@ BASE_DIR = Path(__file__).parent.parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+# Spawned mesh workers (see parallel_mesh) re-run this file as __mp_main__ when the server was
+# started with `python app/main.py`; they need none of the server's state, so its setup is skipped
+SERVER_PROCESS = __name__ != "__mp_main__"
+
 # Directories
 EXPORTS_DIR = BASE_DIR / "exports"
 DESIGNS_DIR = BASE_DIR / "designs"
-EXPORTS_DIR.mkdir(exist_ok=True)
-DESIGNS_DIR.mkdir(exist_ok=True)
+if SERVER_PROCESS:
+    EXPORTS_DIR.mkdir(exist_ok=True)
+    DESIGNS_DIR.mkdir(exist_ok=True)
+
+# Exported files are content-addressed and evicted LRU past this many bytes
+EXPORT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Decoded saved and shared designs are kept in memory, evicted LRU past this many estimated bytes
+DESIGN_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Background export workers (CPU-heavy meshing and zipping stays off the event loop)
+EXPORT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Processes that tessellate very large designs in parallel (1 keeps meshing in-process); capped,
+# and leaving a core per export worker, since those zip and write while the pool meshes
+EXPORT_MESH_PROCESSES = max(1, min(8, (os.cpu_count() or 1) - EXPORT_WORKERS))
+
+# Threads for the blocking file and database calls of request handlers, kept apart from the
+# default threadpool so export work queued there never delays a save or a gallery listing
+IO_WORKERS = 8
 
 # ========== INCLUDE ADVANCED TOOLS ROUTER ==========
 try:
@@ -50,13 +78,14 @@ except ImportError:
 
 # ========== INCLUDE PRINTER HUB ROUTER ==========
 try:
-    from app.printer_hub import router as printer_hub_router
+    from app.printer_hub import router as printer_hub_router, PRINTER_DATABASE
     app.include_router(printer_hub_router)
 except ImportError:
     try:
-        from printer_hub import router as printer_hub_router
+        from printer_hub import router as printer_hub_router, PRINTER_DATABASE
         app.include_router(printer_hub_router)
     except ImportError:
+        PRINTER_DATABASE = {}
         print("Warning: printer_hub.py not found, skipping router")
 
 # ========== INCLUDE AMAZING FEATURES ROUTER ==========
@@ -70,6 +99,53 @@ except ImportError:
     except ImportError:
         print("Warning: amazing_features.py not found, skipping router")
 
+# ========== MESH ENGINE & EXPORT WRITERS (numpy) ==========
+try:
+    from app import mesh_engine, export_writers, shell_merge, voxel_union, parallel_mesh, geometry_library, plate_split
+except ImportError:
+    try:
+        import mesh_engine, export_writers, shell_merge, voxel_union, parallel_mesh, geometry_library, plate_split
+    except ImportError:
+        mesh_engine = export_writers = shell_merge = voxel_union = parallel_mesh = geometry_library = plate_split = None
+
+try:
+    from app import export_cache, export_jobs, design_store, design_index, design_cache, http_cache
+except ImportError:
+    import export_cache, export_jobs, design_store, design_index, design_cache, http_cache
+
+try:
+    from app import share_codec
+except ImportError:
+    try:
+        import share_codec
+    except ImportError:
+        share_codec = None
+
+# Saved designs: indexed SQLite store, seeded once from the legacy per-design JSON files, read
+# through a cache of decoded designs that every save and delete invalidates
+DESIGN_CACHE = design_cache.DesignCache(DESIGN_CACHE_MAX_BYTES)
+if SERVER_PROCESS:
+    DESIGN_STORE = design_store.DesignStore(DESIGNS_DIR / design_store.DB_FILENAME, cache=DESIGN_CACHE)
+    DESIGN_STORE.migrate_json(DESIGNS_DIR)
+
+    # In-process counters for /api/stats, kept current by the handlers that write
+    DESIGN_INDEX = design_index.DesignIndex(DESIGN_STORE)
+    SHARE_INDEX = design_index.FileIndex(DESIGNS_DIR, "shared_*.json")
+
+IO_POOL = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="file-io")
+
+async def _io(fn, *args, **kwargs):
+    """Run blocking filesystem or database work on the I/O pool, off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(IO_POOL, functools.partial(fn, *args, **kwargs))
+
+def _read_json(path):
+    """Parsed JSON file, or None if it does not exist"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
 # ========== LEGO BRICK LIBRARY ==========
 LEGO_BRICKS = {
     "1x1": {"width": 1, "depth": 1, "height": 1, "studs": 1, "name": "1×1 Brick"},
@@ -187,6 +263,21 @@ LEGO_PLATE_HEIGHT_MM = 3.2
 LEGO_STUD_DIAMETER_MM = 4.8
 LEGO_STUD_HEIGHT_MM = 1.7
 
+# Shared export tessellator: one cached unit mesh per brick type
+BRICK_MESHER = mesh_engine.BrickMesher(
+    LEGO_BRICKS, LEGO_UNIT_MM, LEGO_HEIGHT_MM, LEGO_STUD_DIAMETER_MM, LEGO_STUD_HEIGHT_MM,
+) if mesh_engine else None
+
+# Every brick and primitive template, built once and memory-mapped; exporters only instance it
+GEOMETRY_LIBRARY = geometry_library.load_library(
+    EXPORTS_DIR / geometry_library.LIBRARY_FILENAME, BRICK_MESHER,
+) if geometry_library and SERVER_PROCESS else None
+if BRICK_MESHER is not None:
+    BRICK_MESHER.library = GEOMETRY_LIBRARY
+
+# Large designs are split into spatial chunks and tessellated across processes
+PARALLEL_MESHER = parallel_mesh.ParallelTessellator(BRICK_MESHER, EXPORT_MESH_PROCESSES) if parallel_mesh else None
+
 # ========== PRESET DESIGNS ==========
 PRESET_DESIGNS = {
     "house": {
@@ -513,14 +604,14 @@ async def health():
 
 # --- LEGO Brick endpoints ---
 
+BRICKS_RESPONSE = http_cache.CachedJSON(lambda: {"bricks": LEGO_BRICKS, "colors": LEGO_COLORS})
+
 @app.get("/api/bricks")
-async def get_bricks():
+async def get_bricks(request: Request):
     """Get all available LEGO brick types"""
-    return {"bricks": LEGO_BRICKS, "colors": LEGO_COLORS}
+    return BRICKS_RESPONSE.response(request)
 
-@app.get("/api/presets")
-async def get_presets():
-    """Get preset LEGO designs"""
+def _preset_summaries():
     presets = {}
     for key, design in PRESET_DESIGNS.items():
         presets[key] = {
@@ -531,12 +622,23 @@ async def get_presets():
         }
     return {"presets": presets}
 
+PRESETS_RESPONSE = http_cache.CachedJSON(_preset_summaries)
+PRESET_RESPONSES = {
+    name: http_cache.CachedJSON(functools.partial(dict, design=design))
+    for name, design in PRESET_DESIGNS.items()
+}
+
+@app.get("/api/presets")
+async def get_presets(request: Request):
+    """Get preset LEGO designs"""
+    return PRESETS_RESPONSE.response(request)
+
 @app.get("/api/presets/{preset_name}")
-async def get_preset(preset_name: str):
+async def get_preset(preset_name: str, request: Request):
     """Get a specific preset design"""
-    if preset_name not in PRESET_DESIGNS:
+    if preset_name not in PRESET_RESPONSES:
         return JSONResponse({"error": "Preset not found"}, status_code=404)
-    return {"design": PRESET_DESIGNS[preset_name]}
+    return PRESET_RESPONSES[preset_name].response(request)
 
 @app.get("/api/shapes")
 async def get_shapes():
@@ -545,273 +647,442 @@ async def get_shapes():
 
 # --- Design CRUD ---
 
-@app.post("/api/designs/save")
-async def save_design(request: Request):
-    """Save a design to disk"""
-    data = await request.json()
-    design_id = data.get("id", str(uuid.uuid4())[:8])
-    design_name = data.get("name", f"design-{design_id}")
+def _store_design(design_id, design_name, data):
+    """Build, store and index a saved design, keeping what an earlier save of it recorded"""
+    now = time.time()
+    previous = DESIGN_STORE.summary(design_id) or {}
 
     design = {
         "id": design_id,
         "name": design_name,
-        "created_at": time.time(),
+        "created_at": previous.get("created_at", now),
+        "updated_at": now,
         "mode": data.get("mode", "lego"),  # lego or 3d
         "bricks": data.get("bricks", []),
         "shapes": data.get("shapes", []),
         "camera": data.get("camera", {}),
+        "categories": data.get("categories", previous.get("categories", [])),
+        "tags": data.get("tags", previous.get("tags", [])),
         "metadata": {
             "brick_count": len(data.get("bricks", [])),
             "shape_count": len(data.get("shapes", [])),
         }
     }
+    version = DESIGN_STORE.put(design)
+    DESIGN_INDEX.saved(design)
+    return design, version
 
-    filepath = DESIGNS_DIR / f"{design_id}.json"
-    with open(filepath, "w") as f:
-        json.dump(design, f, indent=2)
+@app.post("/api/designs/save")
+async def save_design(request: Request):
+    """Save a design to disk"""
+    data = await request.json()
+    design_id = data.get("id", str(uuid.uuid4())[:8])
+    design_name = data.get("name", f"design-{design_id}")
 
-    return {"status": "saved", "id": design_id, "path": str(filepath)}
+    design, version = await _io(_store_design, design_id, design_name, data)
+    return {"status": "saved", "id": design_id, "updated_at": design["updated_at"], "version": version}
 
 @app.get("/api/designs")
-async def list_designs():
-    """List all saved designs"""
-    designs = []
-    for f in DESIGNS_DIR.glob("*.json"):
-        try:
-            with open(f) as fh:
-                d = json.load(fh)
-                designs.append({
-                    "id": d["id"],
-                    "name": d["name"],
-                    "mode": d.get("mode", "lego"),
-                    "brick_count": d.get("metadata", {}).get("brick_count", 0),
-                    "created_at": d.get("created_at", 0),
-                })
-        except:
-            pass
-    designs.sort(key=lambda x: x["created_at"], reverse=True)
-    return {"designs": designs}
+async def list_designs(sort: str = "created_at", order: str = "desc", limit: int = design_store.DEFAULT_PAGE_SIZE,
+                       cursor: str = None, mode: str = None, tag: str = None, category: str = None):
+    """List saved designs a page at a time
+
+    Pass the returned next_cursor back as cursor for the following page; it is null on the last
+    page. sort is created_at, updated_at, name or brick_count.
+    """
+    try:
+        designs, next_cursor = await _io(DESIGN_STORE.list, sort, order, limit, cursor, mode, tag, category)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {"designs": designs, "next_cursor": next_cursor}
+
+def _design_response(design_id, request):
+    # The validator comes from the indexed version and timestamp, so a revalidation that
+    # matches never reads or encodes the payload
+    revision = DESIGN_STORE.revision(design_id)
+    if revision is None:
+        return JSONResponse({"error": "Design not found"}, status_code=404)
+    etag = http_cache.make_etag(design_id, *revision)
+    if http_cache.not_modified(request, etag):
+        return http_cache.not_modified_response(etag, http_cache.DOCUMENT_CACHE_CONTROL)
+
+    design, version = DESIGN_STORE.get_versioned(design_id)
+    if design is None:
+        return JSONResponse({"error": "Design not found"}, status_code=404)
+    etag = http_cache.make_etag(design_id, version, design_store.design_summary(design)["updated_at"])
+    # Already plain JSON types: skip FastAPI's per-value jsonable_encoder walk over every brick,
+    # and render here on the I/O pool rather than on the event loop
+    return http_cache.json_response({"design": design, "version": version}, etag, http_cache.DOCUMENT_CACHE_CONTROL)
 
 @app.get("/api/designs/{design_id}")
-async def load_design(design_id: str):
+async def load_design(design_id: str, request: Request):
     """Load a specific design"""
-    filepath = DESIGNS_DIR / f"{design_id}.json"
-    if not filepath.exists():
+    return await _io(_design_response, design_id, request)
+
+def _patch_design(design_id, base_version, ops, fields):
+    version, design = DESIGN_STORE.patch(design_id, base_version, ops, fields)
+    if design is not None:
+        DESIGN_INDEX.saved(design)
+    return version, design
+
+@app.patch("/api/designs/{design_id}")
+async def patch_design(design_id: str, request: Request):
+    """Apply brick edits to a saved design without re-sending it
+
+    Body: {"base_version": n, "ops": [...], ...fields}. Ops address bricks by their index in
+    version n: {"op": "add", "brick": {...}}, {"op": "remove", "id": i} and
+    {"op": "update", "id": i, "set": {...}}; name, mode, shapes, camera, tags and categories
+    may be replaced too. Answers 409 with the current version if n is no longer the latest.
+    """
+    data = await request.json()
+    base_version = data.get("base_version")
+    if type(base_version) is not int:
+        return JSONResponse({"error": "base_version required"}, status_code=400)
+
+    try:
+        version, design = await _io(_patch_design, design_id, base_version, data.get("ops", []), data)
+    except design_store.VersionConflict as e:
+        return JSONResponse({"error": str(e), "version": e.version}, status_code=409)
+    except design_store.InvalidPatch as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if design is None:
         return JSONResponse({"error": "Design not found"}, status_code=404)
-    with open(filepath) as f:
-        design = json.load(f)
-    return {"design": design}
+    return {"status": "patched", "id": design_id, "version": version, "updated_at": design["updated_at"],
+            "brick_count": design["metadata"]["brick_count"]}
+
+def _delete_design(design_id):
+    if not DESIGN_STORE.delete(design_id):
+        return False
+    DESIGN_INDEX.deleted(design_id)
+    return True
+
+@app.get("/api/designs/cache/stats")
+async def design_cache_stats():
+    """Hit/miss/eviction counters and estimated memory of the decoded design cache"""
+    return {"cache": DESIGN_CACHE.stats()}
 
 @app.delete("/api/designs/{design_id}")
 async def delete_design(design_id: str):
     """Delete a design"""
-    filepath = DESIGNS_DIR / f"{design_id}.json"
-    if filepath.exists():
-        filepath.unlink()
+    if await _io(_delete_design, design_id):
         return {"status": "deleted", "id": design_id}
     return JSONResponse({"error": "Design not found"}, status_code=404)
 
+# --- Design History ---
+
+@app.get("/api/designs/{design_id}/versions")
+async def list_design_versions(design_id: str):
+    """List a design's saved versions, newest first, with per-version edit counts"""
+    versions = await _io(DESIGN_STORE.versions, design_id)
+    if not versions:
+        return JSONResponse({"error": "Design not found"}, status_code=404)
+    return {"id": design_id, "versions": versions}
+
+def _version_response(design_id, version):
+    design = DESIGN_STORE.version(design_id, version)
+    if design is None:
+        return JSONResponse({"error": "Version not found"}, status_code=404)
+    return JSONResponse({"design": design, "version": version})
+
+@app.get("/api/designs/{design_id}/versions/{version}")
+async def load_design_version(design_id: str, version: int):
+    """Load a design as it was saved at a version"""
+    return await _io(_version_response, design_id, version)
+
+def _revert_design(design_id, version):
+    """Save an old version as the newest one; None if it does not exist"""
+    design = DESIGN_STORE.version(design_id, version)
+    if design is None:
+        return None
+    design["updated_at"] = time.time()
+    new_version = DESIGN_STORE.put(design)
+    DESIGN_INDEX.saved(design)
+    return design, new_version
+
+@app.post("/api/designs/{design_id}/revert")
+async def revert_design(design_id: str, request: Request):
+    """Revert a design to an earlier version; the revert is itself a new version"""
+    data = await request.json()
+    try:
+        version = int(data.get("version"))
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "version required"}, status_code=400)
+
+    reverted = await _io(_revert_design, design_id, version)
+    if reverted is None:
+        return JSONResponse({"error": "Version not found"}, status_code=404)
+    design, new_version = reverted
+    return {"status": "reverted", "id": design_id, "reverted_to": version, "version": new_version,
+            "updated_at": design["updated_at"]}
+
+# --- Export geometry ---
+
+EXPORT_MESH_MODES = ("bricks", "merged", "watertight")
+EXPORT_QUALITY_PROFILES = mesh_engine.QUALITY_PROFILES if mesh_engine else {"standard": {}}
+EXPORT_CACHE = export_cache.ExportCache(EXPORTS_DIR, EXPORT_CACHE_MAX_BYTES) if SERVER_PROCESS else None
+
+def _export_options(mesh_mode, quality, voxel_mm=None, **extra):
+    """Options that change an export's bytes, as hashed into its cache key"""
+    options = {"mesh_mode": mesh_mode, "geometry": GEOMETRY_LIBRARY.fingerprint, **extra}
+    if mesh_mode == "watertight":
+        # Voxelized bodies never touch the tessellation profiles: only the voxel size matters
+        options["voxel_mm"] = float(voxel_mm or voxel_union.DEFAULT_VOXEL_MM)
+    else:
+        options["quality"] = quality
+    return options
+
+EXPORT_JOBS = export_jobs.ExportJobQueue(EXPORT_WORKERS)
+
+def _cached_export_response(kind, cache_key, stream, media_type):
+    """Serve a cached export (file, or an already finished job), or None on a cache miss"""
+    cached = EXPORT_CACHE.get(cache_key)
+    if cached is None:
+        return None
+    if stream:
+        return FileResponse(cached["path"], filename=cached["filename"], media_type=media_type)
+    return EXPORT_JOBS.completed(kind, {**cached, "cached": True}).snapshot()
+
+def _submit_export_job(kind, fn, *args, meta=None, key=None):
+    """Queue fn(report, *args) on the export workers; 202 with the job, or 503 when the queue is full
+
+    An identical export (same cache key) already in flight is returned instead of queued twice.
+    """
+    try:
+        job = EXPORT_JOBS.submit(kind, fn, *args, meta=meta, key=key)
+    except export_jobs.QueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+    return JSONResponse(job.snapshot(), status_code=202)
+
+@app.get("/api/export/cache/stats")
+async def export_cache_stats():
+    """Hit/miss counters and disk usage of the export cache"""
+    return {"cache": EXPORT_CACHE.stats()}
+
+@app.get("/api/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Status of a background export: percent done, ETA and, once finished, the download URL"""
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Export job not found"}, status_code=404)
+    return job.snapshot()
+
+@app.delete("/api/export/jobs/{job_id}")
+async def cancel_export_job(job_id: str):
+    """Cancel a queued or running export"""
+    job = EXPORT_JOBS.cancel(job_id)
+    if job is None:
+        return JSONResponse({"error": "Export job not found"}, status_code=404)
+    return job.snapshot()
+
+@app.get("/api/export/jobs/{job_id}/events")
+async def export_job_events(job_id: str):
+    """Server-sent events stream of an export job's progress, ending when it finishes"""
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Export job not found"}, status_code=404)
+
+    async def events():
+        seen = None
+        while True:
+            if job.version != seen:
+                seen = job.version
+                snapshot = job.snapshot()
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                if snapshot["status"] in export_jobs.TERMINAL_STATES:
+                    return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/export/quality-profiles")
+async def get_quality_profiles():
+    """Get tessellation quality profiles for STL/3MF export"""
+    return {"profiles": EXPORT_QUALITY_PROFILES, "default": "standard"}
+
+def _design_mesh(bricks, mesh_mode="bricks", voxel_mm=None, shapes=(), quality="standard"):
+    """Indexed mesh of a design as (vertices, faces, manifold stats or None)
+
+    "merged" culls hidden faces and merges coplanar ones; "watertight" voxelizes bricks, studs and
+    custom shapes into one welded body. Other modes leave custom shapes to the caller.
+    """
+    if mesh_mode == "watertight":
+        return voxel_union.watertight_mesh(bricks, BRICK_MESHER, voxel_mm or voxel_union.DEFAULT_VOXEL_MM, shapes)
+    if mesh_mode == "merged":
+        return (*shell_merge.merged_shell(bricks, BRICK_MESHER, quality), None)
+    if PARALLEL_MESHER.enabled(bricks):
+        return (*PARALLEL_MESHER.mesh(bricks, quality), None)
+    return (*BRICK_MESHER.mesh(bricks, quality), None)
+
+def _stl_geometry(bricks, shapes, mesh_mode="bricks", voxel_mm=None, quality="standard"):
+    """(vertex count, triangle count, triangle batch iterator, manifold stats) for an STL export"""
+    if mesh_mode == "bricks":
+        # Sized up front from the cached per-type templates, tessellated batch by batch
+        shape_verts, shape_faces = mesh_engine.shapes_mesh(shapes, quality, GEOMETRY_LIBRARY)
+        n_verts, n_faces = BRICK_MESHER.mesh_size(bricks, quality)
+
+        def batches():
+            if PARALLEL_MESHER.enabled(bricks):
+                yield from PARALLEL_MESHER.iter_stl_records(bricks, quality)
+            else:
+                yield from BRICK_MESHER.iter_triangles(bricks, quality)
+            yield shape_verts[shape_faces]
+
+        return n_verts + len(shape_verts), n_faces + len(shape_faces), batches(), None
+
+    verts, faces, stats = _design_mesh(bricks, mesh_mode, voxel_mm, shapes, quality)
+    if mesh_mode != "watertight":
+        verts, faces = mesh_engine.merge_meshes([(verts, faces), mesh_engine.shapes_mesh(shapes, quality, GEOMETRY_LIBRARY)])
+    return len(verts), len(faces), mesh_engine.iter_mesh_triangles(verts, faces), stats
+
 # --- STL Export ---
 
+def _export_stl_file(report, bricks, shapes, design_name, mesh_mode, voxel_mm, quality, cache_key):
+    """Export job body: mesh the design and write a binary STL into EXPORTS_DIR"""
+    n_verts, n_faces, triangle_batches, manifold = _stl_geometry(bricks, shapes, mesh_mode, voxel_mm, quality)
+    if not n_faces:
+        raise ValueError("No geometry to export")
+
+    filename = f"{design_name}_{cache_key[:12]}.stl"
+    filepath = EXPORTS_DIR / filename
+    export_writers.write_binary_stl(filepath, design_name, n_faces, triangle_batches, progress=report)
+
+    result = {
+        "status": "exported",
+        "filename": filename,
+        "path": str(filepath),
+        "mesh_mode": mesh_mode,
+        "quality": quality,
+        "vertices": n_verts,
+        "faces": n_faces,
+        "download_url": f"/api/export/download/{filename}"
+    }
+    if manifold:
+        result["manifold"] = manifold
+    EXPORT_CACHE.put(cache_key, filename, result)
+    return {**result, "cached": False}
+
+def _iter_ascii_stl(bricks, design_name):
+    """Fallback: simple ASCII STL text without numpy, one brick at a time"""
+    yield f"solid {design_name}\n"
+    for brick_data in bricks:
+        f = io.StringIO()
+        brick_type = brick_data.get("type", "2x4")
+        brick_info = LEGO_BRICKS.get(brick_type, LEGO_BRICKS["2x4"])
+        x = brick_data.get("x", 0) * LEGO_UNIT_MM
+        y = brick_data.get("y", 0) * LEGO_UNIT_MM
+        z = brick_data.get("z", 0) * LEGO_HEIGHT_MM
+        w = brick_info["width"] * LEGO_UNIT_MM
+        d = brick_info["depth"] * LEGO_UNIT_MM
+        h = brick_info["height"] * LEGO_HEIGHT_MM
+
+        # Write box as 12 triangles
+        # Bottom
+        f.write(f"  facet normal 0 0 -1\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y} {z}\n      vertex {x+w} {y+d} {z}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        f.write(f"  facet normal 0 0 -1\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y+d} {z}\n      vertex {x} {y+d} {z}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        # Top
+        f.write(f"  facet normal 0 0 1\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z+h}\n      vertex {x+w} {y+d} {z+h}\n      vertex {x+w} {y} {z+h}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        f.write(f"  facet normal 0 0 1\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z+h}\n      vertex {x} {y+d} {z+h}\n      vertex {x+w} {y+d} {z+h}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        # Front
+        f.write(f"  facet normal 0 -1 0\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y} {z+h}\n      vertex {x+w} {y} {z}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        f.write(f"  facet normal 0 -1 0\n    outer loop\n")
+        f.write(f"      vertex {x} {y} {z}\n      vertex {x} {y} {z+h}\n      vertex {x+w} {y} {z+h}\n")
+        f.write(f"    endloop\n  endfacet\n")
+        yield f.getvalue()
+    yield f"endsolid {design_name}\n"
+
+def _export_ascii_stl(bricks, design_name, design_id):
+    """Fallback: generate a simple ASCII STL without numpy"""
+    filename = f"{design_name}_{design_id}.stl"
+    filepath = EXPORTS_DIR / filename
+
+    with open(filepath, "w") as f:
+        f.writelines(_iter_ascii_stl(bricks, design_name))
+
+    return {
+        "status": "exported",
+        "filename": filename,
+        "path": str(filepath),
+        "format": "ascii_stl",
+        "note": "Basic STL (install numpy for full quality)",
+        "download_url": f"/api/export/download/{filename}"
+    }
+
 @app.post("/api/export/stl")
 async def export_stl(request: Request):
-    """Export design as STL file for 3D printing"""
+    """Export design as STL file for 3D printing
+
+    Returns a background job (202) to poll or follow over SSE; with "stream": true the STL is
+    streamed back directly instead.
+    """
     data = await request.json()
     bricks = data.get("bricks", [])
     shapes = data.get("shapes", [])
     design_name = data.get("name", "design")
     design_id = data.get("id", str(uuid.uuid4())[:8])
+    mesh_mode = data.get("mesh_mode", "bricks")  # bricks, merged or watertight
+    voxel_mm = data.get("voxel_mm")  # watertight resolution
+    quality = data.get("quality", "standard")  # draft, standard or fine
+
+    if not bricks and not shapes:
+        return JSONResponse({"error": "No geometry to export"}, status_code=400)
+    if mesh_mode not in EXPORT_MESH_MODES:
+        return JSONResponse({"error": f"Unknown mesh_mode: {mesh_mode}"}, status_code=400)
+    if quality not in EXPORT_QUALITY_PROFILES:
+        return JSONResponse({"error": f"Unknown quality profile: {quality}"}, status_code=400)
+    unvoxelized = voxel_union.unsupported_shapes(shapes) if voxel_union and mesh_mode == "watertight" else []
+    if unvoxelized:
+        return JSONResponse({"error": f"Cannot build a watertight body from shapes of type: {', '.join(unvoxelized)}"},
+                            status_code=400)
 
     try:
-        import numpy as np
-        from stl import mesh as stl_mesh
-
-        all_vertices = []
-        all_faces = []
-        vertex_offset = 0
-
-        # Convert LEGO bricks to 3D geometry
-        for brick_data in bricks:
-            brick_type = brick_data.get("type", "2x4")
-            brick_info = LEGO_BRICKS.get(brick_type, LEGO_BRICKS["2x4"])
-
-            # Position in mm
-            x = brick_data.get("x", 0) * LEGO_UNIT_MM
-            y = brick_data.get("y", 0) * LEGO_UNIT_MM
-            z = brick_data.get("z", 0) * LEGO_HEIGHT_MM
-
-            w = brick_info["width"] * LEGO_UNIT_MM
-            d = brick_info["depth"] * LEGO_UNIT_MM
-            h = brick_info["height"] * LEGO_HEIGHT_MM
-
-            shape = brick_info.get("shape", "box")
-
-            if shape == "box" or shape == "slope":
-                # Box vertices
-                verts = np.array([
-                    [x, y, z], [x+w, y, z], [x+w, y+d, z], [x, y+d, z],
-                    [x, y, z+h], [x+w, y, z+h], [x+w, y+d, z+h], [x, y+d, z+h],
-                ])
-                faces = np.array([
-                    [0,1,2], [0,2,3],  # bottom
-                    [4,6,5], [4,7,6],  # top
-                    [0,4,5], [0,5,1],  # front
-                    [2,6,7], [2,7,3],  # back
-                    [0,3,7], [0,7,4],  # left
-                    [1,5,6], [1,6,2],  # right
-                ]) + vertex_offset
-                all_vertices.append(verts)
-                all_faces.append(faces)
-                vertex_offset += 8
-
-                # Add studs on top
-                stud_r = LEGO_STUD_DIAMETER_MM / 2
-                stud_h = LEGO_STUD_HEIGHT_MM
-                for sw in range(int(brick_info["width"])):
-                    for sd in range(int(brick_info["depth"])):
-                        cx = x + sw * LEGO_UNIT_MM + LEGO_UNIT_MM / 2
-                        cy = y + sd * LEGO_UNIT_MM + LEGO_UNIT_MM / 2
-                        cz = z + h
-
-                        # Approximate cylinder with 8-sided polygon
-                        n_sides = 8
-                        bottom_verts = []
-                        top_verts = []
-                        for i in range(n_sides):
-                            angle = 2 * np.pi * i / n_sides
-                            bx = cx + stud_r * np.cos(angle)
-                            by = cy + stud_r * np.sin(angle)
-                            bottom_verts.append([bx, by, cz])
-                            top_verts.append([bx, by, cz + stud_h])
-
-                        stud_verts = np.array(bottom_verts + top_verts + [[cx, cy, cz], [cx, cy, cz + stud_h]])
-                        stud_faces = []
-
-                        # Side faces
-                        for i in range(n_sides):
-                            ni = (i + 1) % n_sides
-                            stud_faces.append([i, ni, ni + n_sides])
-                            stud_faces.append([i, ni + n_sides, i + n_sides])
-
-                        # Bottom cap
-                        center_bottom = 2 * n_sides
-                        for i in range(n_sides):
-                            ni = (i + 1) % n_sides
-                            stud_faces.append([center_bottom, ni, i])
-
-                        # Top cap
-                        center_top = 2 * n_sides + 1
-                        for i in range(n_sides):
-                            ni = (i + 1) % n_sides
-                            stud_faces.append([center_top, i + n_sides, ni + n_sides])
-
-                        stud_faces = np.array(stud_faces) + vertex_offset
-                        all_vertices.append(stud_verts)
-                        all_faces.append(stud_faces)
-                        vertex_offset += len(stud_verts)
-
-        # Convert custom 3D shapes
-        for shape_data in shapes:
-            shape_type = shape_data.get("type", "cube")
-            sx = shape_data.get("x", 0)
-            sy = shape_data.get("y", 0)
-            sz = shape_data.get("z", 0)
-            scale = shape_data.get("scale", 10)
-
-            if shape_type == "cube":
-                s = scale / 2
-                verts = np.array([
-                    [sx-s, sy-s, sz-s], [sx+s, sy-s, sz-s],
-                    [sx+s, sy+s, sz-s], [sx-s, sy+s, sz-s],
-                    [sx-s, sy-s, sz+s], [sx+s, sy-s, sz+s],
-                    [sx+s, sy+s, sz+s], [sx-s, sy+s, sz+s],
-                ])
-                faces = np.array([
-                    [0,1,2], [0,2,3], [4,6,5], [4,7,6],
-                    [0,4,5], [0,5,1], [2,6,7], [2,7,3],
-                    [0,3,7], [0,7,4], [1,5,6], [1,6,2],
-                ]) + vertex_offset
-                all_vertices.append(verts)
-                all_faces.append(faces)
-                vertex_offset += 8
-
-        if not all_vertices:
-            return JSONResponse({"error": "No geometry to export"}, status_code=400)
-
-        # Combine all geometry
-        combined_verts = np.vstack(all_vertices)
-        combined_faces = np.vstack(all_faces)
-
-        # Create STL mesh
-        stl_data = stl_mesh.Mesh(np.zeros(len(combined_faces), dtype=stl_mesh.Mesh.dtype))
-        for i, face in enumerate(combined_faces):
-            for j in range(3):
-                stl_data.vectors[i][j] = combined_verts[face[j]]
-
-        # Save
-        filename = f"{design_name}_{design_id}.stl"
-        filepath = EXPORTS_DIR / filename
-        stl_data.save(str(filepath))
-
-        return {
-            "status": "exported",
-            "filename": filename,
-            "path": str(filepath),
-            "vertices": len(combined_verts),
-            "faces": len(combined_faces),
-            "download_url": f"/api/export/download/{filename}"
-        }
+        if mesh_engine is None:
+            raise ImportError("numpy is required for binary STL export")
+
+        # Identical design + options: return the existing artifact
+        cache_key = export_cache.design_hash("stl", bricks, shapes, _export_options(mesh_mode, quality, voxel_mm))
+        cached = await _io(_cached_export_response, "stl", cache_key, data.get("stream"), "model/stl")
+        if cached is not None:
+            return cached
+
+        if data.get("stream"):
+            n_verts, n_faces, triangle_batches, _ = await run_in_threadpool(
+                _stl_geometry, bricks, shapes, mesh_mode, voxel_mm, quality)
+            if not n_faces:
+                return JSONResponse({"error": "No geometry to export"}, status_code=400)
+            return StreamingResponse(
+                export_writers.iter_binary_stl(design_name, n_faces, triangle_batches),
+                media_type="model/stl",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{design_name}_{cache_key[:12]}.stl"',
+                    "Content-Length": str(export_writers.stl_size(n_faces)),
+                },
+            )
+
+        return _submit_export_job("stl", _export_stl_file, bricks, shapes, design_name, mesh_mode, voxel_mm,
+                                  quality, cache_key, meta={"mesh_mode": mesh_mode, "quality": quality}, key=cache_key)
+
+    except ValueError as e:
+        # e.g. watertight volume too large for the requested voxel_mm
+        return JSONResponse({"error": str(e)}, status_code=400)
 
-    except ImportError as e:
-        # Fallback: generate a simple ASCII STL
-        filename = f"{design_name}_{design_id}.stl"
-        filepath = EXPORTS_DIR / filename
-
-        with open(filepath, "w") as f:
-            f.write(f"solid {design_name}\n")
-            for brick_data in bricks:
-                brick_type = brick_data.get("type", "2x4")
-                brick_info = LEGO_BRICKS.get(brick_type, LEGO_BRICKS["2x4"])
-                x = brick_data.get("x", 0) * LEGO_UNIT_MM
-                y = brick_data.get("y", 0) * LEGO_UNIT_MM
-                z = brick_data.get("z", 0) * LEGO_HEIGHT_MM
-                w = brick_info["width"] * LEGO_UNIT_MM
-                d = brick_info["depth"] * LEGO_UNIT_MM
-                h = brick_info["height"] * LEGO_HEIGHT_MM
-
-                # Write box as 12 triangles
-                # Bottom
-                f.write(f"  facet normal 0 0 -1\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y} {z}\n      vertex {x+w} {y+d} {z}\n")
-                f.write(f"    endloop\n  endfacet\n")
-                f.write(f"  facet normal 0 0 -1\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y+d} {z}\n      vertex {x} {y+d} {z}\n")
-                f.write(f"    endloop\n  endfacet\n")
-                # Top
-                f.write(f"  facet normal 0 0 1\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z+h}\n      vertex {x+w} {y+d} {z+h}\n      vertex {x+w} {y} {z+h}\n")
-                f.write(f"    endloop\n  endfacet\n")
-                f.write(f"  facet normal 0 0 1\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z+h}\n      vertex {x} {y+d} {z+h}\n      vertex {x+w} {y+d} {z+h}\n")
-                f.write(f"    endloop\n  endfacet\n")
-                # Front
-                f.write(f"  facet normal 0 -1 0\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z}\n      vertex {x+w} {y} {z+h}\n      vertex {x+w} {y} {z}\n")
-                f.write(f"    endloop\n  endfacet\n")
-                f.write(f"  facet normal 0 -1 0\n    outer loop\n")
-                f.write(f"      vertex {x} {y} {z}\n      vertex {x} {y} {z+h}\n      vertex {x+w} {y} {z+h}\n")
-                f.write(f"    endloop\n  endfacet\n")
-
-            f.write(f"endsolid {design_name}\n")
-
-        return {
-            "status": "exported",
-            "filename": filename,
-            "path": str(filepath),
-            "format": "ascii_stl",
-            "note": "Basic STL (install numpy-stl for full quality)",
-            "download_url": f"/api/export/download/{filename}"
-        }
+    except ImportError:
+        if data.get("stream"):
+            return StreamingResponse(
+                (chunk.encode() for chunk in _iter_ascii_stl(bricks, design_name)),
+                media_type="model/stl",
+                headers={"Content-Disposition": f'attachment; filename="{design_name}_{design_id}.stl"'},
+            )
+        return await _io(_export_ascii_stl, bricks, design_name, design_id)
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -820,7 +1091,7 @@ async def export_stl(request: Request):
 async def download_export(filename: str):
     """Download an exported file"""
     filepath = EXPORTS_DIR / filename
-    if not filepath.exists():
+    if not await _io(filepath.is_file):
         return JSONResponse({"error": "File not found"}, status_code=404)
     return FileResponse(str(filepath), filename=filename, media_type="application/octet-stream")
 
@@ -862,6 +1133,11 @@ async def prepare_for_bambu(request: Request):
             "P1S": width_mm <= 256 and depth_mm <= 256 and height_mm <= 256,
             "X1C": width_mm <= 256 and depth_mm <= 256 and height_mm <= 256,
         },
+        # Oversized designs can be exported split across plates: POST /api/export/3mf with "printer"
+        "plates_needed": {
+            key: len(plate_split.split_sections(bricks, BRICK_MESHER, p["bed_size"]))
+            for key, p in PRINTER_DATABASE.items() if p.get("brand") == "Bambu Lab"
+        } if plate_split else {},
         "recommended_settings": {
             "layer_height": "0.16mm (for LEGO-like quality)",
             "infill": "20% (gyroid pattern)",
@@ -891,10 +1167,12 @@ async def prepare_for_bambu(request: Request):
 
 # --- Technic Parts endpoints ---
 
+TECHNIC_RESPONSE = http_cache.CachedJSON(lambda: {"parts": TECHNIC_PARTS})
+
 @app.get("/api/technic")
-async def get_technic_parts():
+async def get_technic_parts(request: Request):
     """Get all available Technic parts"""
-    return {"parts": TECHNIC_PARTS}
+    return TECHNIC_RESPONSE.response(request)
 
 # --- Minifigure endpoints ---
 
@@ -1106,25 +1384,27 @@ async def measure_design(request: Request):
 
 # --- AMS Multi-Color Export ---
 
+def _color_groups(bricks):
+    """Colors in AMS slot order (most-used first) and brick indices per color, in one pass
+
+    Returns ([{"name", "hex", "count"}, ...], {color: [brick index, ...]}).
+    """
+    groups = {}
+    for i, brick in enumerate(bricks):
+        groups.setdefault(brick.get("color", "red"), []).append(i)
+    colors = [{"name": color, "hex": LEGO_COLORS.get(color, "#CC0000"), "count": len(indices)}
+              for color, indices in groups.items()]
+    colors.sort(key=lambda c: c["count"], reverse=True)
+    return colors, groups
+
 @app.post("/api/export/ams")
 async def export_ams_config(request: Request):
     """Generate Bambu AMS (Automatic Material System) color config"""
     data = await request.json()
     bricks = data.get("bricks", [])
 
-    # Gather unique colors used
-    colors_used = {}
-    for brick in bricks:
-        color = brick.get("color", "red")
-        hex_color = LEGO_COLORS.get(color, "#CC0000")
-        colors_used[color] = {
-            "name": color,
-            "hex": hex_color,
-            "count": colors_used.get(color, {}).get("count", 0) + 1
-        }
-
     # AMS has 4 slots, assign most-used colors first
-    sorted_colors = sorted(colors_used.values(), key=lambda c: c["count"], reverse=True)
+    sorted_colors, _ = _color_groups(bricks)
     ams_slots = []
     for i, color in enumerate(sorted_colors[:4]):
         ams_slots.append({
@@ -1139,7 +1419,7 @@ async def export_ams_config(request: Request):
 
     return {
         "ams_config": {
-            "total_colors": len(colors_used),
+            "total_colors": len(sorted_colors),
             "ams_slots": ams_slots,
             "extra_colors": [{"name": c["name"], "hex": c["hex"], "count": c["count"]} for c in extra_colors],
             "needs_manual_swap": len(extra_colors) > 0,
@@ -1152,115 +1432,174 @@ async def export_ams_config(request: Request):
 
 # --- 3MF Export for Bambu Studio ---
 
+# 3MF also supports "instanced": one mesh object per brick template, placed by components
+THREEMF_MESH_MODES = EXPORT_MESH_MODES + ("instanced",)
+
+def _3mf_model(bricks, mesh_mode, voxel_mm, quality, colors=True, bed_size=None, progress=None):
+    """(3D/3dmodel.model chunk iterator, extra package entries, mesh stats) for a 3MF export
+
+    With colors, bricks are split into one object per color, painted from a <basematerials> group
+    listed in the same slot order as /api/export/ams. With a bed_size the design is cut into
+    sections that fit it, each moved onto its own plate and listed in Bambu's model settings.
+    """
+    plates = plate_split.layout_sections(bricks, BRICK_MESHER, bed_size) if bed_size else None
+    palette, _ = _color_groups(bricks) if colors else ([], {})
+    materials = [(c["name"], c["hex"]) for c in palette]
+    paint = {c["name"]: k for k, c in enumerate(palette)}
+    stats = {"vertices": 0, "triangles": 0}
+
+    def painted(group):
+        """(local brick indices, pindex) per color of a brick list, in slot order"""
+        if not colors:
+            return [(list(range(len(group))), None)]
+        _, groups = _color_groups(group)
+        return sorted(((idx, paint[color]) for color, idx in groups.items()), key=lambda p: p[1])
+
+    if mesh_mode == "instanced":
+        studded = BRICK_MESHER.stud_flags(bricks, quality)
+        parts = []
+        for idx, material in painted(bricks):
+            group = [bricks[i] for i in idx]
+            flags = None if studded is None else studded[idx]
+            parts += [(v, f, o, material) for v, f, o in BRICK_MESHER.instances(group, quality, flags)]
+        stats["vertices"] = sum(len(v) for v, _, _, _ in parts)
+        stats["triangles"] = sum(len(f) for _, f, _, _ in parts)
+        stats.update(objects=len(parts), instances=sum(len(o) for _, _, o, _ in parts))
+        if colors:
+            stats["materials"] = len(materials)
+        return export_writers.iter_3mf_instanced_model(parts, materials, progress), [], stats
+
+    # Build mesh data per section and color (instanced brick templates, merged shell or watertight body)
+    objects, object_plates, names, manifold = [], [], [], {}
+    for plate, (section, offset) in enumerate(plates or [(range(len(bricks)), None)], start=1):
+        section_bricks = [bricks[i] for i in section]
+        # Stud culling looks at the whole section, not just one color
+        studded = BRICK_MESHER.stud_flags(section_bricks, quality) if mesh_mode == "bricks" else None
+        for idx, material in painted(section_bricks):
+            group = [section_bricks[i] for i in idx]
+            label = palette[material]["name"] if colors else "model"
+            if plates:
+                label = f"plate {plate} {label}"
+            if mesh_mode == "bricks":
+                mesher = PARALLEL_MESHER if PARALLEL_MESHER.enabled(group) else BRICK_MESHER
+                vertices, triangles = mesher.indexed(group, quality, None if studded is None else studded[idx])
+            else:
+                vertices, triangles, manifold[label] = _design_mesh(group, mesh_mode, voxel_mm, quality=quality)
+            if offset is not None:
+                vertices = (vertices + offset).astype(vertices.dtype)
+            objects.append((vertices, triangles, material))
+            object_plates.append(plate)
+            names.append(label)
+            stats["vertices"] += len(vertices)
+            stats["triangles"] += len(triangles)
+    if any(manifold.values()):
+        stats["manifold"] = manifold if colors or plates else manifold["model"]
+    if colors:
+        stats["materials"] = len(materials)
+
+    extra = []
+    if plates:
+        stats["plates"] = len(plates)
+        settings = export_writers.threemf_plate_settings(names, object_plates, [m for _, _, m in objects], materials)
+        extra.append((export_writers.THREEMF_PLATE_SETTINGS, [settings]))
+    return export_writers.iter_3mf_model(objects, materials, progress), extra, stats
+
+def _export_3mf_file(report, bricks, design_name, mesh_mode, voxel_mm, quality, colors, bed_size, compression, cache_key):
+    """Export job body: mesh the design and zip it into a 3MF in EXPORTS_DIR"""
+    filename = f"{design_name}_{cache_key[:12]}.3mf"
+    filepath = EXPORTS_DIR / filename
+
+    model, extra, stats = _3mf_model(bricks, mesh_mode, voxel_mm, quality, colors, bed_size, progress=report)
+    if not stats["triangles"]:
+        raise ValueError("No geometry to export")
+
+    # 3MF is a ZIP file containing XML, zipped as the XML is generated
+    packing = {}
+    file_size = export_writers.write_stream(filepath, export_writers.iter_3mf_package(model, extra, compression, packing))
+
+    result = {
+        "status": "exported",
+        "filename": filename,
+        "format": "3mf",
+        "path": str(filepath),
+        "file_size_kb": round(file_size / 1024, 1),
+        "mesh_mode": mesh_mode,
+        "quality": quality,
+        **stats,
+        "compression": packing,
+        "brick_count": len(bricks),
+        "download_url": f"/api/export/download/{filename}",
+        "note": "Open this file directly in Bambu Studio or OrcaSlicer!"
+    }
+    EXPORT_CACHE.put(cache_key, filename, result)
+    return {**result, "cached": False}
+
 @app.post("/api/export/3mf")
 async def export_3mf(request: Request):
-    """Export design as 3MF file — native format for Bambu Studio"""
+    """Export design as 3MF file — native format for Bambu Studio
+
+    Runs as a background job (202); poll its status_url or follow its events_url. With
+    "stream": true the 3MF is zipped straight into the response instead, without touching disk.
+    Bricks are split into one painted object per color unless "colors": false, and with a
+    "printer" the design is cut into sections laid out as plates that fit its bed. "compression"
+    trades speed for size (store, fast, standard or max); finished jobs report the ratio and time.
+    """
     data = await request.json()
     bricks = data.get("bricks", [])
     design_name = data.get("name", "design")
-    design_id = data.get("id", str(uuid.uuid4())[:8])
+    mesh_mode = data.get("mesh_mode", "bricks")  # bricks, merged, watertight or instanced
+    voxel_mm = data.get("voxel_mm")  # watertight resolution
+    quality = data.get("quality", "standard")  # draft, standard or fine
+    colors = bool(data.get("colors", True))  # one painted object per color, in AMS slot order
+    printer = data.get("printer")  # PRINTER_DATABASE key: split into plates that fit its bed
+    compression = data.get("compression", "standard")  # store, fast, standard or max
 
     if not bricks:
         return JSONResponse({"error": "No bricks to export"}, status_code=400)
+    if mesh_mode not in THREEMF_MESH_MODES:
+        return JSONResponse({"error": f"Unknown mesh_mode: {mesh_mode}"}, status_code=400)
+    if quality not in EXPORT_QUALITY_PROFILES:
+        return JSONResponse({"error": f"Unknown quality profile: {quality}"}, status_code=400)
+    if export_writers and compression not in export_writers.ZIP_PROFILES:
+        return JSONResponse({"error": f"Unknown compression: {compression}"}, status_code=400)
+    if printer is not None and printer not in PRINTER_DATABASE:
+        return JSONResponse({"error": f"Unknown printer: {printer}"}, status_code=400)
+    if printer is not None and mesh_mode == "instanced":
+        return JSONResponse({"error": "Plate splitting is not available with mesh_mode instanced"}, status_code=400)
+    bed_size = PRINTER_DATABASE[printer]["bed_size"] if printer else None
 
     try:
-        import zipfile
-        import xml.etree.ElementTree as ET
-
-        # 3MF is a ZIP file containing XML
-        filename = f"{design_name}_{design_id}.3mf"
-        filepath = EXPORTS_DIR / filename
-
-        # Build mesh data
-        vertices = []
-        triangles = []
-        vertex_offset = 0
-
-        for brick_data in bricks:
-            brick_type = brick_data.get("type", "2x4")
-            brick_info = LEGO_BRICKS.get(brick_type, LEGO_BRICKS["2x4"])
-
-            x = brick_data.get("x", 0) * LEGO_UNIT_MM
-            y = brick_data.get("y", 0) * LEGO_UNIT_MM
-            z = brick_data.get("z", 0) * LEGO_HEIGHT_MM
-
-            w = brick_info["width"] * LEGO_UNIT_MM
-            d = brick_info["depth"] * LEGO_UNIT_MM
-            h = brick_info["height"] * LEGO_HEIGHT_MM
-
-            # Box vertices (8 corners)
-            verts = [
-                (x, y, z), (x+w, y, z), (x+w, y+d, z), (x, y+d, z),
-                (x, y, z+h), (x+w, y, z+h), (x+w, y+d, z+h), (x, y+d, z+h),
-            ]
-            vertices.extend(verts)
-
-            # 12 triangles for a box
-            faces = [
-                (0,2,1), (0,3,2),   # bottom
-                (4,5,6), (4,6,7),   # top
-                (0,1,5), (0,5,4),   # front
-                (2,3,7), (2,7,6),   # back
-                (0,4,7), (0,7,3),   # left
-                (1,2,6), (1,6,5),   # right
-            ]
-            for f in faces:
-                triangles.append((f[0]+vertex_offset, f[1]+vertex_offset, f[2]+vertex_offset))
-            vertex_offset += 8
-
-        # Build 3MF XML
-        model_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        model_xml += '<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
-        model_xml += '  <resources>\n'
-        model_xml += '    <object id="1" type="model">\n'
-        model_xml += '      <mesh>\n'
-        model_xml += '        <vertices>\n'
-        for v in vertices:
-            model_xml += f'          <vertex x="{v[0]}" y="{v[1]}" z="{v[2]}" />\n'
-        model_xml += '        </vertices>\n'
-        model_xml += '        <triangles>\n'
-        for t in triangles:
-            model_xml += f'          <triangle v1="{t[0]}" v2="{t[1]}" v3="{t[2]}" />\n'
-        model_xml += '        </triangles>\n'
-        model_xml += '      </mesh>\n'
-        model_xml += '    </object>\n'
-        model_xml += '  </resources>\n'
-        model_xml += '  <build>\n'
-        model_xml += '    <item objectid="1" />\n'
-        model_xml += '  </build>\n'
-        model_xml += '</model>'
-
-        content_types = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        content_types += '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">\n'
-        content_types += '  <Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml" />\n'
-        content_types += '  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />\n'
-        content_types += '</Types>'
-
-        rels = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        rels += '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">\n'
-        rels += '  <Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel" />\n'
-        rels += '</Relationships>'
-
-        # Create ZIP (3MF is ZIP)
-        with zipfile.ZipFile(str(filepath), 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('[Content_Types].xml', content_types)
-            zf.writestr('_rels/.rels', rels)
-            zf.writestr('3D/3dmodel.model', model_xml)
-
-        file_size = filepath.stat().st_size
-
-        return {
-            "status": "exported",
-            "filename": filename,
-            "format": "3mf",
-            "path": str(filepath),
-            "file_size_kb": round(file_size / 1024, 1),
-            "vertices": len(vertices),
-            "triangles": len(triangles),
-            "brick_count": len(bricks),
-            "download_url": f"/api/export/download/{filename}",
-            "note": "Open this file directly in Bambu Studio or OrcaSlicer!"
-        }
+        if mesh_engine is None:
+            raise ImportError("numpy is required for 3MF export")
+        if bed_size:
+            # Fails fast (400) when a single brick cannot fit the bed
+            plate_split.section_span(plate_split.brick_boxes(bricks, BRICK_MESHER), BRICK_MESHER, bed_size)
+
+        # Identical design + options: return the existing artifact
+        cache_key = export_cache.design_hash("3mf", bricks, (), _export_options(mesh_mode, quality, voxel_mm, colors=colors, bed_size=bed_size,
+                                                                              compression=compression))
+        cached = await _io(_cached_export_response, "3mf", cache_key, data.get("stream"), "model/3mf")
+        if cached is not None:
+            return cached
+
+        if data.get("stream"):
+            model, extra, stats = await run_in_threadpool(_3mf_model, bricks, mesh_mode, voxel_mm, quality, colors, bed_size)
+            if not stats["triangles"]:
+                return JSONResponse({"error": "No geometry to export"}, status_code=400)
+            return StreamingResponse(
+                export_writers.iter_3mf_package(model, extra, compression),
+                media_type="model/3mf",
+                headers={"Content-Disposition": f'attachment; filename="{design_name}_{cache_key[:12]}.3mf"'},
+            )
+
+        return _submit_export_job("3mf", _export_3mf_file, bricks, design_name, mesh_mode, voxel_mm, quality,
+                                  colors, bed_size, compression, cache_key,
+                                  meta={"mesh_mode": mesh_mode, "quality": quality, "compression": compression},
+                                  key=cache_key)
+
+    except ValueError as e:
+        # e.g. watertight volume too large for the requested voxel_mm
+        return JSONResponse({"error": str(e)}, status_code=400)
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1279,47 +1618,93 @@ async def search_bricks(q: str = ""):
 
 # --- Design Share (URL based) ---
 
+def _share(name, bricks):
+    """Share code and content-addressed id of a design, stored once however often it is shared"""
+    code = None
+    if share_codec is not None:
+        try:
+            code = share_codec.encode_share(name, bricks)
+        except share_codec.ShareCodecError:
+            pass  # bricks the code cannot hold are still shared by id
+    if code is not None:
+        share_id = share_codec.share_key(code)
+    else:
+        canonical = json.dumps({"n": name, "b": bricks}, sort_keys=True, separators=(",", ":"), default=str)
+        share_id = hashlib.blake2b(canonical.encode(), digest_size=6).hexdigest()
+
+    filepath = DESIGNS_DIR / f"shared_{share_id}.json"
+    if not filepath.exists():
+        design = {
+            "id": share_id,
+            "name": name,
+            "created_at": time.time(),
+            "bricks": bricks,
+            "shared": True,
+            "code": code,
+        }
+        design_store.write_atomic(filepath, json.dumps(design, separators=(",", ":")).encode())
+        SHARE_INDEX.added(filepath.name)
+    return share_id, code
+
 @app.post("/api/designs/share")
 async def share_design(request: Request):
-    """Generate a shareable design code"""
+    """Generate a shareable design code
+
+    The code rebuilds the design on its own (see /api/designs/share/decode); the short share_url
+    is keyed by the design's content, so sharing the same design again reuses it.
+    """
     data = await request.json()
     bricks = data.get("bricks", [])
     name = data.get("name", "Shared Design")
 
-    # Create a compact JSON and base64 encode
-    import base64
-    compact = json.dumps({"n": name, "b": bricks}, separators=(',', ':'))
-    encoded = base64.urlsafe_b64encode(compact.encode()).decode()
-
-    # Save as shared design
-    share_id = str(uuid.uuid4())[:8]
-    design = {
-        "id": share_id,
-        "name": name,
-        "created_at": time.time(),
-        "bricks": bricks,
-        "shared": True,
-        "code": encoded[:100] + "..." if len(encoded) > 100 else encoded,
-    }
-    filepath = DESIGNS_DIR / f"shared_{share_id}.json"
-    with open(filepath, "w") as f:
-        json.dump(design, f, indent=2)
-
+    share_id, code = await _io(_share, name, bricks)
     return {
         "share_id": share_id,
         "share_url": f"/api/designs/shared/{share_id}",
-        "code_length": len(encoded),
+        "code": code,
+        "code_length": len(code) if code else 0,
     }
 
+@app.post("/api/designs/share/decode")
+async def decode_share_code(request: Request):
+    """Rebuild a shared design from its code alone"""
+    data = await request.json()
+    code = data.get("code")
+    if not isinstance(code, str) or not code:
+        return JSONResponse({"error": "code required"}, status_code=400)
+    if share_codec is None:
+        return JSONResponse({"error": "Share codes need NumPy"}, status_code=501)
+    try:
+        name, bricks = await _io(share_codec.decode_share, code)
+    except share_codec.ShareCodecError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({"design": {"name": name, "bricks": bricks, "shared": True}})
+
+def _shared_response(filepath, request):
+    # Shares are written once under their content hash: the file's identity is a strong validator,
+    # checked with a stat before the file is opened
+    try:
+        st = filepath.stat()
+    except FileNotFoundError:
+        return JSONResponse({"error": "Shared design not found"}, status_code=404)
+    etag = http_cache.make_etag(filepath.name, st.st_mtime_ns, st.st_size)
+    if http_cache.not_modified(request, etag):
+        return http_cache.not_modified_response(etag, http_cache.IMMUTABLE_CACHE_CONTROL)
+    # Keyed by the validator too, so a rewritten file can never be served from an older parse
+    key = ("shared", filepath.name, etag)
+    design = DESIGN_CACHE.get(key)
+    if design is None:
+        generation = DESIGN_CACHE.generation()
+        design = _read_json(filepath)
+        if design is None:
+            return JSONResponse({"error": "Shared design not found"}, status_code=404)
+        DESIGN_CACHE.put(key, design, design_cache.estimate_bytes(st.st_size), generation)
+    return http_cache.json_response({"design": design}, etag, http_cache.IMMUTABLE_CACHE_CONTROL)
+
 @app.get("/api/designs/shared/{share_id}")
-async def get_shared_design(share_id: str):
+async def get_shared_design(share_id: str, request: Request):
     """Load a shared design"""
-    filepath = DESIGNS_DIR / f"shared_{share_id}.json"
-    if not filepath.exists():
-        return JSONResponse({"error": "Shared design not found"}, status_code=404)
-    with open(filepath) as f:
-        design = json.load(f)
-    return {"design": design}
+    return await _io(_shared_response, DESIGNS_DIR / f"shared_{share_id}.json", request)
 
 # --- Animation / Turntable ---
 
@@ -1420,6 +1805,18 @@ async def estimate_cost(request: Request):
 
 # --- Design Categories and Tags ---
 
+def _categorize(design_id, categories, tags):
+    """Store new categories and tags on a design; None if it does not exist"""
+    design = DESIGN_STORE.get(design_id)
+    if design is None:
+        return None
+    design["categories"] = categories
+    design["tags"] = tags
+    design["updated_at"] = time.time()
+    DESIGN_STORE.put(design)
+    DESIGN_INDEX.saved(design)
+    return design
+
 @app.post("/api/designs/categorize")
 async def categorize_design(request: Request):
     """Add categories and tags to a design"""
@@ -1431,20 +1828,9 @@ async def categorize_design(request: Request):
     if not design_id:
         return JSONResponse({"error": "design id required"}, status_code=400)
 
-    filepath = DESIGNS_DIR / f"{design_id}.json"
-    if not filepath.exists():
+    if await _io(_categorize, design_id, categories, tags) is None:
         return JSONResponse({"error": "Design not found"}, status_code=404)
 
-    with open(filepath) as f:
-        design = json.load(f)
-
-    design["categories"] = categories
-    design["tags"] = tags
-    design["updated_at"] = time.time()
-
-    with open(filepath, "w") as f:
-        json.dump(design, f, indent=2)
-
     return {"status": "updated", "id": design_id, "categories": categories, "tags": tags}
 
 # --- LDraw Import (basic .ldr parser) ---
@@ -1584,7 +1970,18 @@ async def generate_assembly_animation(request: Request):
 # ========== SCREENSHOT GALLERY ==========
 
 SCREENSHOTS_DIR = BASE_DIR / "screenshots"
-SCREENSHOTS_DIR.mkdir(exist_ok=True)
+if SERVER_PROCESS:
+    SCREENSHOTS_DIR.mkdir(exist_ok=True)
+    SCREENSHOT_INDEX = design_index.FileIndex(SCREENSHOTS_DIR, "*.png")
+
+    # Picks up designs, shares and screenshots changed on disk by anything but these handlers
+    design_index.start_reconciler([DESIGN_INDEX, SHARE_INDEX, SCREENSHOT_INDEX])
+
+def _write_screenshot(filepath, image_data):
+    import base64
+
+    design_store.write_atomic(filepath, base64.b64decode(image_data))
+    SCREENSHOT_INDEX.added(filepath.name)
 
 @app.post("/api/screenshots/save")
 async def save_screenshot(request: Request):
@@ -1596,8 +1993,6 @@ async def save_screenshot(request: Request):
     if not image_data:
         return JSONResponse({"error": "No image data"}, status_code=400)
 
-    import base64
-
     # Remove data:image/png;base64, prefix
     if "," in image_data:
         image_data = image_data.split(",")[1]
@@ -1605,8 +2000,7 @@ async def save_screenshot(request: Request):
     filename = f"{name}_{int(time.time())}.png"
     filepath = SCREENSHOTS_DIR / filename
 
-    with open(filepath, "wb") as f:
-        f.write(base64.b64decode(image_data))
+    await _io(_write_screenshot, filepath, image_data)
 
     return {
         "status": "saved",
@@ -1615,31 +2009,46 @@ async def save_screenshot(request: Request):
         "download_url": f"/api/screenshots/{filename}",
     }
 
+def _screenshot_entries():
+    """Screenshots newest first, each file stat()ed once"""
+    entries = []
+    for f in SCREENSHOTS_DIR.glob("*.png"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue  # deleted since the glob
+        entries.append((st.st_mtime, f.name, st.st_size))
+    entries.sort(reverse=True)
+    return [{
+        "filename": name,
+        "size_kb": round(size / 1024, 1),
+        "created": mtime,
+        "url": f"/api/screenshots/{name}",
+    } for mtime, name, size in entries]
+
 @app.get("/api/screenshots")
 async def list_screenshots():
     """List all saved screenshots"""
-    screenshots = []
-    for f in sorted(SCREENSHOTS_DIR.glob("*.png"), key=lambda f: f.stat().st_mtime, reverse=True):
-        screenshots.append({
-            "filename": f.name,
-            "size_kb": round(f.stat().st_size / 1024, 1),
-            "created": f.stat().st_mtime,
-            "url": f"/api/screenshots/{f.name}",
-        })
-    return {"screenshots": screenshots}
+    return {"screenshots": await _io(_screenshot_entries)}
 
 @app.get("/api/screenshots/{filename}")
 async def get_screenshot(filename: str):
     filepath = SCREENSHOTS_DIR / filename
-    if not filepath.exists():
+    if not await _io(filepath.is_file):
         return JSONResponse({"error": "Not found"}, status_code=404)
     return FileResponse(str(filepath), media_type="image/png")
 
+def _delete_screenshot(filepath):
+    try:
+        filepath.unlink()
+    except FileNotFoundError:
+        return False
+    SCREENSHOT_INDEX.removed(filepath.name)
+    return True
+
 @app.delete("/api/screenshots/{filename}")
 async def delete_screenshot(filename: str):
-    filepath = SCREENSHOTS_DIR / filename
-    if filepath.exists():
-        filepath.unlink()
+    if await _io(_delete_screenshot, SCREENSHOTS_DIR / filename):
         return {"status": "deleted"}
     return JSONResponse({"error": "Not found"}, status_code=404)
 
@@ -1757,9 +2166,11 @@ MATERIAL_PRESETS = {
     "wood": {"name": "Wood", "roughness": 0.85, "metalness": 0.0, "description": "Natural wood look"},
 }
 
+MATERIAL_PRESETS_RESPONSE = http_cache.CachedJSON(lambda: {"materials": MATERIAL_PRESETS})
+
 @app.get("/api/materials")
-async def get_material_presets():
-    return {"materials": MATERIAL_PRESETS}
+async def get_material_presets(request: Request):
+    return MATERIAL_PRESETS_RESPONSE.response(request)
 
 
 # ========== DESIGN TEMPLATES (Multi-Design Scenes) ==========
@@ -1868,15 +2279,15 @@ async def load_scene(request: Request):
 @app.get("/api/stats")
 async def get_stats():
     """Get overall app statistics"""
-    design_count = len(list(DESIGNS_DIR.glob("*.json")))
-    export_count = len(list(EXPORTS_DIR.glob("*")))
-    screenshot_count = len(list(SCREENSHOTS_DIR.glob("*.png")))
+    designs = DESIGN_INDEX.stats()
 
     return {
         "stats": {
-            "saved_designs": design_count,
-            "exports": export_count,
-            "screenshots": screenshot_count,
+            "saved_designs": designs["designs"],
+            "designs_by_mode": designs["by_mode"],
+            "shared_designs": len(SHARE_INDEX),
+            "exports": len(EXPORT_CACHE),
+            "screenshots": len(SCREENSHOT_INDEX),
             "available_bricks": len(LEGO_BRICKS),
             "available_technic": len(TECHNIC_PARTS),
             "available_minifig": len(MINIFIG_PARTS),
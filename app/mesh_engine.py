@@ -0,0 +1,458 @@
+"""
+Mesh Engine — Template-instanced tessellation for STL/3MF export
+Builds one unit mesh per brick type (body + studs) and places every brick with NumPy broadcasting
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+
+# ========== UNIT GEOMETRY ==========
+
+# Box corners: bottom ring 0-3, top ring 4-7 (counter-clockwise seen from above)
+BOX_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+], dtype=np.float32)
+
+# 12 outward-wound triangles for a box
+BOX_FACES = np.array([
+    [0, 2, 1], [0, 3, 2],   # bottom
+    [4, 5, 6], [4, 6, 7],   # top
+    [0, 1, 5], [0, 5, 4],   # front
+    [2, 3, 7], [2, 7, 6],   # back
+    [0, 4, 7], [0, 7, 3],   # left
+    [1, 2, 6], [1, 6, 5],   # right
+], dtype=np.int32)
+
+# Brick shapes that fill their whole footprint cell grid (for occupancy and hidden-face culling)
+BOX_SHAPES = {"box"}
+
+
+def box_mesh(w, d, h):
+    """Box from the origin to (w, d, h) as (vertices, faces)"""
+    return BOX_CORNERS * np.array([w, d, h], dtype=np.float32), BOX_FACES.copy()
+
+
+@lru_cache(maxsize=None)
+def lathe_mesh(profile, n_sides):
+    """Closed surface of revolution around the z axis, cached per (profile, n_sides)
+
+    profile is a tuple of (radius, z) points from bottom to top; a radius of 0 at either end closes
+    the solid with an apex instead of a flat cap.
+    """
+    angles = 2 * np.pi * np.arange(n_sides) / n_sides
+    unit_ring = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    rings = profile[int(profile[0][0] == 0):len(profile) - int(profile[-1][0] == 0)]
+
+    verts = np.zeros((len(rings) * n_sides + 2, 3), dtype=np.float32)
+    for k, (r, z) in enumerate(rings):
+        verts[k * n_sides:(k + 1) * n_sides, :2] = unit_ring * r
+        verts[k * n_sides:(k + 1) * n_sides, 2] = z
+    bottom_center, top_center = len(rings) * n_sides, len(rings) * n_sides + 1
+    verts[bottom_center, 2] = profile[0][1]
+    verts[top_center, 2] = profile[-1][1]
+
+    i = np.arange(n_sides, dtype=np.int32)
+    ni = (i + 1) % n_sides
+    faces = [np.stack([np.full(n_sides, bottom_center), ni, i], axis=1)]   # bottom cap or apex
+    for k in range(len(rings) - 1):
+        lo, hi = k * n_sides, (k + 1) * n_sides
+        faces.append(np.stack([lo + i, lo + ni, hi + ni], axis=1))         # sides
+        faces.append(np.stack([lo + i, hi + ni, hi + i], axis=1))
+    last = (len(rings) - 1) * n_sides
+    faces.append(np.stack([np.full(n_sides, top_center), last + i, last + ni], axis=1))  # top cap or apex
+    faces = np.concatenate(faces).astype(np.int32)
+    verts.setflags(write=False)
+    faces.setflags(write=False)
+    return verts, faces
+
+
+@lru_cache(maxsize=None)
+def revolve_loop(loop, n_sides):
+    """Surface of revolution of a closed (radius, z) polygon around the z axis, e.g. a tube or torus
+
+    loop must run counter-clockwise in the (radius, z) plane and stay clear of the axis.
+    """
+    angles = 2 * np.pi * np.arange(n_sides) / n_sides
+    unit_ring = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    verts = np.zeros((len(loop) * n_sides, 3), dtype=np.float32)
+    for k, (r, z) in enumerate(loop):
+        verts[k * n_sides:(k + 1) * n_sides, :2] = unit_ring * r
+        verts[k * n_sides:(k + 1) * n_sides, 2] = z
+
+    i = np.arange(n_sides, dtype=np.int32)
+    ni = (i + 1) % n_sides
+    faces = []
+    for k in range(len(loop)):
+        lo, hi = k * n_sides, (k + 1) % len(loop) * n_sides
+        faces.append(np.stack([lo + i, lo + ni, hi + ni], axis=1))
+        faces.append(np.stack([lo + i, hi + ni, hi + i], axis=1))
+    faces = np.concatenate(faces).astype(np.int32)
+    verts.setflags(write=False)
+    faces.setflags(write=False)
+    return verts, faces
+
+
+def prism_mesh(polygon, length):
+    """Convex (y, z) polygon, counter-clockwise, extruded along x from 0 to length"""
+    n = len(polygon)
+    ring = np.asarray(polygon, dtype=np.float32)
+    verts = np.zeros((2 * n, 3), dtype=np.float32)
+    verts[:n, 1:] = ring
+    verts[n:, 1:] = ring
+    verts[n:, 0] = length
+
+    i = np.arange(n, dtype=np.int32)
+    ni = (i + 1) % n
+    fan = np.arange(1, n - 1, dtype=np.int32)
+    faces = [
+        np.stack([np.zeros_like(fan), fan + 1, fan], axis=1),            # x = 0 cap
+        np.stack([np.full_like(fan, n), n + fan, n + fan + 1], axis=1),  # x = length cap
+        np.stack([i, ni, n + ni], axis=1),                               # sides
+        np.stack([i, n + ni, n + i], axis=1),
+    ]
+    return verts, np.concatenate(faces).astype(np.int32)
+
+
+def stud_mesh(radius, height, n_sides=8):
+    """Closed n-sided cylinder centered on the origin, base at z=0"""
+    return lathe_mesh(((radius, 0.0), (radius, height)), n_sides)
+
+
+def merge_meshes(parts):
+    """Concatenate (vertices, faces) pairs into one indexed mesh"""
+    verts, faces, offset = [], [], 0
+    for v, f in parts:
+        verts.append(v)
+        faces.append(f + offset)
+        offset += len(v)
+    if not verts:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int32)
+    return np.concatenate(verts).astype(np.float32), np.concatenate(faces).astype(np.int32)
+
+
+def instance_mesh(verts, faces, origins):
+    """Place one template at every origin with a single broadcast translate"""
+    n = len(origins)
+    placed = (verts[None, :, :] + origins[:, None, :]).reshape(-1, 3)
+    offsets = (np.arange(n, dtype=np.int32) * len(verts))[:, None, None]
+    return placed.astype(np.float32), (faces[None, :, :] + offsets).reshape(-1, 3)
+
+
+def instance_triangles(verts, faces, origins):
+    """Triangle soup (n * F, 3, 3) of one template placed at every origin"""
+    tris = verts[faces]
+    return (tris[None, :, :, :] + origins[:, None, None, :]).reshape(-1, 3, 3).astype(np.float32)
+
+
+# ========== QUALITY PROFILES ==========
+
+# Tessellation density per feature; "cull_buried_studs" drops studs hidden under other bricks
+QUALITY_PROFILES = {
+    "draft": {"stud_sides": 6, "round_sides": 10, "dome_rings": 2, "cull_buried_studs": True},
+    "standard": {"stud_sides": 8, "round_sides": 16, "dome_rings": 4, "cull_buried_studs": False},
+    "fine": {"stud_sides": 24, "round_sides": 48, "dome_rings": 12, "cull_buried_studs": True},
+}
+DEFAULT_QUALITY = "standard"
+
+PLATES_PER_BRICK = 3
+
+
+def brick_cells(info):
+    """Footprint and height of a brick in grid cells (studs, studs, plates)"""
+    return int(info["width"]), int(info["depth"]), max(1, int(round(info["height"] * PLATES_PER_BRICK)))
+
+
+def slope_rows(info):
+    """Stud rows on the flat back strip of a slope brick"""
+    return min(int(info["depth"]), max(1, int(info.get("studs", 1)) // int(info["width"])))
+
+
+def occupancy_grid(bricks, mesher):
+    """Rasterize box-shaped bricks into a boolean stud × stud × plate grid
+
+    Returns (grid, origin, studs) where origin is the grid cell of index (0, 0, 0) and studs is an
+    (n, 3) array of stud cells sitting on top of a brick.
+    """
+    groups = {}
+    for b in bricks:
+        info = mesher.brick_info(b.get("type", mesher.default_type))
+        if info.get("shape", "box") not in BOX_SHAPES:
+            continue
+        groups.setdefault(brick_cells(info), []).append(
+            (round(b.get("x", 0)), round(b.get("y", 0)), round(b.get("z", 0) * PLATES_PER_BRICK)))
+
+    if not groups:
+        return np.zeros((0, 0, 0), dtype=bool), np.zeros(3, dtype=np.int64), np.zeros((0, 3), dtype=np.int64)
+
+    # Every cell covered by every brick, one broadcast per brick size
+    cells, studs = [], []
+    for (w, d, h), origins in groups.items():
+        origins = np.asarray(origins, dtype=np.int64)
+        offsets = np.stack(np.meshgrid(np.arange(w), np.arange(d), np.arange(h), indexing="ij"), axis=-1).reshape(-1, 3)
+        cells.append((origins[:, None, :] + offsets[None, :, :]).reshape(-1, 3))
+        top = offsets[offsets[:, 2] == 0] + np.array([0, 0, h])
+        studs.append((origins[:, None, :] + top[None, :, :]).reshape(-1, 3))
+    cells = np.concatenate(cells)
+    studs = np.concatenate(studs)
+
+    origin = cells.min(axis=0)
+    shape = cells.max(axis=0) - origin + 1
+    grid = np.zeros(tuple(shape), dtype=bool)
+    local = cells - origin
+    grid[local[:, 0], local[:, 1], local[:, 2]] = True
+    return grid, origin, studs
+
+
+def covered_cells(grid, origin, cells):
+    """Which of the (n, 3) cells are filled in the grid"""
+    local = cells - origin
+    inside = np.all((local >= 0) & (local < np.array(grid.shape)), axis=-1)
+    covered = np.zeros(cells.shape[:-1], dtype=bool)
+    covered[inside] = grid[local[inside][:, 0], local[inside][:, 1], local[inside][:, 2]]
+    return covered
+
+
+# ========== BRICK MESHER ==========
+
+class BrickMesher:
+    """Caches one unit mesh per brick type and quality profile, and instances designs from it"""
+
+    def __init__(self, brick_library, unit_mm, height_mm, stud_diameter_mm, stud_height_mm,
+                 default_type="2x4", library=None):
+        self.brick_library = brick_library
+        self.unit_mm = unit_mm
+        self.height_mm = height_mm
+        self.stud_radius = stud_diameter_mm / 2
+        self.stud_height = stud_height_mm
+        self.default_type = default_type
+        self.library = library  # precompiled GeometryLibrary, consulted before building a template
+        self._templates = {}
+
+    def brick_info(self, brick_type):
+        return self.brick_library.get(brick_type, self.brick_library[self.default_type])
+
+    def template(self, brick_type, quality=DEFAULT_QUALITY, studded=True):
+        """Unit mesh (vertices, faces) for a brick type at the origin, built once per profile"""
+        key = (brick_type, quality, studded)
+        if key not in self._templates:
+            found = self.library.brick(brick_type, quality, studded) if self.library is not None else None
+            self._templates[key] = found or self.build_template(self.brick_info(brick_type), QUALITY_PROFILES[quality], studded)
+        return self._templates[key]
+
+    def stud_template(self, quality=DEFAULT_QUALITY):
+        """Unit stud mesh centered on the origin, base at z=0"""
+        return stud_mesh(self.stud_radius, self.stud_height, QUALITY_PROFILES[quality]["stud_sides"])
+
+    def build_template(self, info, profile, studded):
+        """Unit mesh of a brick description, tessellated fresh for a quality profile"""
+        shape = info.get("shape", "box")
+        w = info["width"] * self.unit_mm
+        d = info["depth"] * self.unit_mm
+        h = info["height"] * self.height_mm
+        center = np.array([w / 2, d / 2, 0], dtype=np.float32)
+        radius = min(w, d) / 2
+        stud_v, stud_f = stud_mesh(self.stud_radius, self.stud_height, profile["stud_sides"])
+
+        if shape == "box":
+            parts = [box_mesh(w, d, h)]
+            stud_centers = [((sw + 0.5) * self.unit_mm, (sd + 0.5) * self.unit_mm)
+                            for sw in range(int(info["width"])) for sd in range(int(info["depth"]))]
+        elif shape == "slope":
+            # Studded flat strip along the back, slope down to a one-plate lip at the front (y = 0)
+            rows = slope_rows(info)
+            flat = rows * self.unit_mm
+            parts = [prism_mesh(((0, 0), (d, 0), (d, h), (d - flat, h), (0, h / PLATES_PER_BRICK)), w)]
+            stud_centers = [((sw + 0.5) * self.unit_mm, (sd + 0.5) * self.unit_mm)
+                            for sw in range(int(info["width"])) for sd in range(int(info["depth"]) - rows, int(info["depth"]))]
+        elif shape == "cylinder":
+            body_v, body_f = lathe_mesh(((radius, 0.0), (radius, h)), profile["round_sides"])
+            parts = [(body_v + center, body_f)]
+            stud_centers = [(w / 2, d / 2)] if info.get("studs", 0) else []
+        elif shape == "cone":
+            top = min(self.stud_radius, radius)
+            body_v, body_f = lathe_mesh(((radius, 0.0), (top, h)), profile["round_sides"])
+            parts = [(body_v + center, body_f)]
+            stud_centers = [(w / 2, d / 2)] if info.get("studs", 0) else []
+        elif shape == "dome":
+            # Quarter-ellipse profile from the footprint rim up to an apex
+            t = np.linspace(0, np.pi / 2, profile["dome_rings"] + 2)
+            points = tuple((float(radius * np.cos(a)), float(h * np.sin(a))) for a in t[:-1]) + ((0.0, float(h)),)
+            body_v, body_f = lathe_mesh(points, profile["round_sides"])
+            parts = [(body_v + center, body_f)]
+            stud_centers = []
+        else:
+            return merge_meshes([])
+
+        if studded:
+            for cx, cy in stud_centers:
+                parts.append((stud_v + np.array([cx, cy, h], dtype=np.float32), stud_f))
+        return merge_meshes(parts)
+
+    def buried_bricks(self, bricks):
+        """Per-brick mask: True when every stud on top is covered by another brick"""
+        buried = np.zeros(len(bricks), dtype=bool)
+        grid, origin, _ = occupancy_grid(bricks, self)
+        if not grid.size:
+            return buried
+        groups = {}
+        for i, b in enumerate(bricks):
+            info = self.brick_info(b.get("type", self.default_type))
+            if info.get("shape", "box") in BOX_SHAPES:
+                groups.setdefault(brick_cells(info), []).append(
+                    (i, round(b.get("x", 0)), round(b.get("y", 0)), round(b.get("z", 0) * PLATES_PER_BRICK)))
+        for (w, d, h), rows in groups.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            top = np.stack(np.meshgrid(np.arange(w), np.arange(d), [h], indexing="ij"), axis=-1).reshape(-1, 3)
+            cells = rows[:, None, 1:] + top[None, :, :]
+            buried[rows[:, 0]] = covered_cells(grid, origin, cells).all(axis=1)
+        return buried
+
+    def stud_flags(self, bricks, quality):
+        """Per-brick stud flags for a profile, or None when every brick keeps its studs"""
+        if not QUALITY_PROFILES[quality]["cull_buried_studs"]:
+            return None
+        return ~self.buried_bricks(bricks)
+
+    def group_bricks(self, bricks, studded=None):
+        """Brick origins in mm grouped by (type, studded): {key: (n, 3) array}"""
+        groups = {}
+        for i, b in enumerate(bricks):
+            key = (b.get("type", self.default_type), True if studded is None else bool(studded[i]))
+            groups.setdefault(key, []).append((b.get("x", 0), b.get("y", 0), b.get("z", 0)))
+        scale = np.array([self.unit_mm, self.unit_mm, self.height_mm], dtype=np.float32)
+        return {key: np.asarray(pos, dtype=np.float32) * scale for key, pos in groups.items()}
+
+    def mesh(self, bricks, quality=DEFAULT_QUALITY):
+        """Indexed mesh (vertices, faces) of a whole design"""
+        return self.indexed(bricks, quality, self.stud_flags(bricks, quality))
+
+    def indexed(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """Indexed mesh of a set of bricks with explicit per-brick stud flags (None keeps all studs)"""
+        parts = []
+        for (brick_type, has_studs), origins in self.group_bricks(bricks, studded).items():
+            verts, faces = self.template(brick_type, quality, has_studs)
+            if len(faces):
+                parts.append(instance_mesh(verts, faces, origins))
+        return merge_meshes(parts)
+
+    def instances(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """(vertices, faces, origins) per used template, for writers that place templates themselves"""
+        parts = []
+        for (brick_type, has_studs), origins in self.group_bricks(bricks, studded).items():
+            verts, faces = self.template(brick_type, quality, has_studs)
+            if len(faces):
+                parts.append((verts, faces, origins))
+        return parts
+
+    def brick_sizes(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """Per-brick (vertex counts, triangle counts) as two int64 arrays"""
+        sizes = {}
+        counts = np.zeros((len(bricks), 2), dtype=np.int64)
+        for i, b in enumerate(bricks):
+            key = (b.get("type", self.default_type), True if studded is None else bool(studded[i]))
+            if key not in sizes:
+                verts, faces = self.template(key[0], quality, key[1])
+                sizes[key] = (len(verts), len(faces))
+            counts[i] = sizes[key]
+        return counts[:, 0], counts[:, 1]
+
+    def mesh_size(self, bricks, quality=DEFAULT_QUALITY):
+        """(vertex count, triangle count) a design tessellates to, without building it"""
+        n_verts, n_faces = self.brick_sizes(bricks, quality, self.stud_flags(bricks, quality))
+        return int(n_verts.sum()), int(n_faces.sum())
+
+    def iter_triangles(self, bricks, quality=DEFAULT_QUALITY, max_triangles=65536):
+        """Yield triangle soup batches of roughly max_triangles, a few bricks at a time"""
+        studded = self.stud_flags(bricks, quality)
+        start, budget = 0, 0
+        for i, b in enumerate(bricks):
+            has_studs = True if studded is None else bool(studded[i])
+            budget += len(self.template(b.get("type", self.default_type), quality, has_studs)[1])
+            if budget >= max_triangles:
+                yield self.triangles(bricks[start:i + 1], quality, None if studded is None else studded[start:i + 1])
+                start, budget = i + 1, 0
+        if start < len(bricks):
+            yield self.triangles(bricks[start:], quality, None if studded is None else studded[start:])
+
+    def triangles(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """Triangle soup (N, 3, 3) of a set of bricks, for STL"""
+        tris = [np.zeros((0, 3, 3), dtype=np.float32)]
+        for (brick_type, has_studs), origins in self.group_bricks(bricks, studded).items():
+            verts, faces = self.template(brick_type, quality, has_studs)
+            if len(faces):
+                tris.append(instance_triangles(verts, faces, origins))
+        return np.concatenate(tris)
+
+
+def iter_mesh_triangles(verts, faces, max_triangles=65536):
+    """Yield triangle soup batches of an indexed mesh"""
+    for start in range(0, len(faces), max_triangles):
+        yield verts[faces[start:start + max_triangles]]
+
+
+# ========== CUSTOM SHAPES ==========
+
+# Custom shape types with a unit mesh (see SHAPE_PRIMITIVES in main)
+PRIMITIVE_TYPES = ("cube", "sphere", "cylinder", "cone", "torus", "pyramid", "wedge", "tube")
+
+PYRAMID_VERTICES = np.array([
+    [-0.5, -0.5, -0.5], [0.5, -0.5, -0.5], [0.5, 0.5, -0.5], [-0.5, 0.5, -0.5], [0, 0, 0.5],
+], dtype=np.float32)
+PYRAMID_FACES = np.array([[0, 2, 1], [0, 3, 2], [0, 1, 4], [1, 2, 4], [2, 3, 4], [3, 0, 4]], dtype=np.int32)
+
+
+def primitive_mesh(kind, quality=DEFAULT_QUALITY):
+    """Unit mesh of a custom shape type, centered on the origin and fitting a 1 × 1 × 1 box
+
+    Unknown types give an empty mesh.
+    """
+    profile = QUALITY_PROFILES[quality]
+    sides = profile["round_sides"]
+    if kind == "cube":
+        return box_mesh(1, 1, 1)[0] - 0.5, BOX_FACES.copy()
+    if kind == "sphere":
+        # Exact zero radius at the poles, so lathe_mesh closes them with apexes instead of rings
+        t = np.linspace(-np.pi / 2, np.pi / 2, 2 * profile["dome_rings"] + 3)
+        points = tuple((float(0.5 * np.cos(a)), float(0.5 * np.sin(a))) for a in t[1:-1])
+        return lathe_mesh(((0.0, -0.5),) + points + ((0.0, 0.5),), sides)
+    if kind == "cylinder":
+        return lathe_mesh(((0.5, -0.5), (0.5, 0.5)), sides)
+    if kind == "cone":
+        return lathe_mesh(((0.5, -0.5), (0.0, 0.5)), sides)
+    if kind == "torus":
+        # Ring radius 0.35, tube radius 0.15: 1 across and 0.3 tall
+        t = 2 * np.pi * np.arange(max(6, sides // 2)) / max(6, sides // 2)
+        return revolve_loop(tuple((float(0.35 + 0.15 * np.cos(a)), float(0.15 * np.sin(a))) for a in t), sides)
+    if kind == "pyramid":
+        return PYRAMID_VERTICES.copy(), PYRAMID_FACES.copy()
+    if kind == "wedge":
+        verts, faces = prism_mesh(((-0.5, -0.5), (0.5, -0.5), (-0.5, 0.5)), 1)
+        return verts - np.array([0.5, 0, 0], dtype=np.float32), faces
+    if kind == "tube":
+        return revolve_loop(((0.5, -0.5), (0.5, 0.5), (0.3, 0.5), (0.3, -0.5)), sides)
+    return merge_meshes([])
+
+
+def shapes_mesh(shapes, quality=DEFAULT_QUALITY, library=None):
+    """Indexed mesh of custom 3D shapes, centered on x/y/z and sized by scale
+
+    Unit meshes come from the precompiled library when one is given.
+    """
+    groups = {}
+    for s in shapes:
+        groups.setdefault(s.get("type", "cube"), []).append(s)
+    parts = []
+    for kind, group in groups.items():
+        found = library.primitive(kind, quality) if library is not None else None
+        verts, faces = found or primitive_mesh(kind, quality)
+        if not len(faces):
+            continue
+        centers = np.array([[s.get("x", 0), s.get("y", 0), s.get("z", 0)] for s in group], dtype=np.float32)
+        scales = np.array([s.get("scale", 10) for s in group], dtype=np.float32)
+        placed = verts[None, :, :] * scales[:, None, None] + centers[:, None, :]
+        offsets = (np.arange(len(group), dtype=np.int32) * len(verts))[:, None, None]
+        parts.append((placed.reshape(-1, 3), (faces[None, :, :] + offsets).reshape(-1, 3)))
+    return merge_meshes(parts)
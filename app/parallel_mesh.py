@@ -0,0 +1,234 @@
+"""
+Parallel Mesh — Multi-process tessellation for very large designs
+Bricks are partitioned into spatial chunks, tessellated in a process pool, and written by the
+workers straight into one shared-memory buffer at precomputed offsets, so the parent never
+concatenates or copies chunk results
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+try:
+    from app.mesh_engine import DEFAULT_QUALITY
+    from app.export_writers import STL_RECORD, fill_stl_records
+except ImportError:
+    from mesh_engine import DEFAULT_QUALITY
+    from export_writers import STL_RECORD, fill_stl_records
+
+PARALLEL_MIN_BRICKS = 20000
+CHUNK_TRIANGLES = 131072
+SPATIAL_TILE_STUDS = 16
+
+
+# ========== PARTITIONING ==========
+
+def spatial_order(bricks, tile=SPATIAL_TILE_STUDS):
+    """Brick indices ordered tile by tile (tile × tile studs), so consecutive runs are compact regions"""
+    xy = np.array([(b.get("x", 0), b.get("y", 0)) for b in bricks], dtype=np.float64).reshape(-1, 2)
+    tiles = np.floor(xy / tile).astype(np.int64)
+    return np.lexsort((xy[:, 1], xy[:, 0], tiles[:, 1], tiles[:, 0]))
+
+
+def chunk_bounds(face_counts, chunk_triangles=CHUNK_TRIANGLES):
+    """Split per-brick triangle counts into [start, stop) runs of about chunk_triangles each"""
+    if not len(face_counts):
+        return np.zeros(1, dtype=np.int64)
+    ends = np.cumsum(face_counts)
+    cuts = np.searchsorted(ends, np.arange(chunk_triangles, ends[-1], chunk_triangles), side="left") + 1
+    return np.unique(np.concatenate([[0], cuts, [len(face_counts)]]))
+
+
+# ========== SHARED BUFFERS ==========
+
+class _ArrayInterface:
+    """Raw byte view of a shared buffer that keeps the buffer alive for as long as NumPy uses it"""
+
+    def __init__(self, owner, nbytes):
+        self.owner = owner
+        self.__array_interface__ = {"shape": (nbytes,), "typestr": "|u1", "data": (owner.address, False), "version": 3}
+
+
+class SharedBuffer:
+    """A SharedMemory block whose NumPy views own it; it is released when the last view dies"""
+
+    def __init__(self, nbytes):
+        self.nbytes = max(1, int(nbytes))
+        self.shm = SharedMemory(create=True, size=self.nbytes)
+        self.name = self.shm.name
+        probe = np.frombuffer(self.shm.buf, dtype=np.uint8)
+        self.address = probe.ctypes.data
+        del probe
+        self._linked = True
+
+    def array(self, shape, dtype, offset=0):
+        """Writable view of part of the buffer"""
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        raw = np.asarray(_ArrayInterface(self, self.nbytes))
+        return raw[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+
+    def unlink(self):
+        """Drop the buffer's name once every worker is done with it; existing views stay valid"""
+        if self._linked:
+            self._linked = False
+            self.shm.unlink()
+
+    def __del__(self):
+        if hasattr(self, "_linked"):
+            self.shm.close()
+            self.unlink()
+
+
+# ========== WORKERS ==========
+
+_MESHER = None
+
+
+def _init_worker(mesher):
+    global _MESHER
+    _MESHER = mesher
+
+
+def _worker_view(shm, shape, dtype, offset):
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def _mesh_chunk(name, n_verts, bricks, studded, quality, vertex_offset, face_offset):
+    """Tessellate one chunk into the shared vertex/face arrays of a whole design"""
+    verts, faces = _MESHER.indexed(bricks, quality, studded)
+    shm = SharedMemory(name=name)
+    try:
+        out_v = _worker_view(shm, verts.shape, np.float32, vertex_offset * 12)
+        out_f = _worker_view(shm, faces.shape, np.int32, n_verts * 12 + face_offset * 12)
+        out_v[:] = verts
+        np.add(faces, vertex_offset, out=out_f, casting="unsafe")
+        del out_v, out_f
+    finally:
+        shm.close()
+    return len(faces)
+
+
+def _stl_chunk(name, record_offset, bricks, studded, quality):
+    """Tessellate one chunk straight into packed binary STL records"""
+    tris = _MESHER.triangles(bricks, quality, studded)
+    shm = SharedMemory(name=name)
+    try:
+        records = _worker_view(shm, (len(tris),), STL_RECORD, record_offset * STL_RECORD.itemsize)
+        fill_stl_records(records, tris)
+        del records
+    finally:
+        shm.close()
+    return len(tris)
+
+
+# ========== TESSELLATOR ==========
+
+class ParallelTessellator:
+    """Spreads a BrickMesher's work over a process pool for designs of min_bricks or more"""
+
+    def __init__(self, mesher, workers=None, min_bricks=PARALLEL_MIN_BRICKS, chunk_triangles=CHUNK_TRIANGLES):
+        self.mesher = mesher
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.min_bricks = min_bricks
+        self.chunk_triangles = chunk_triangles
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def enabled(self, bricks):
+        return self.workers > 1 and len(bricks) >= self.min_bricks
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a threaded server process is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.mesher,))
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def plan(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """Spatial chunks as (bricks, stud flags, vertex offset, face offset, faces) plus totals"""
+        order = spatial_order(bricks)
+        ordered = [bricks[i] for i in order]
+        flags = None if studded is None else studded[order]
+        n_verts, n_faces = self.mesher.brick_sizes(ordered, quality, flags)
+        vertex_starts = np.concatenate([[0], np.cumsum(n_verts)])
+        face_starts = np.concatenate([[0], np.cumsum(n_faces)])
+        bounds = chunk_bounds(n_faces, self.chunk_triangles).tolist()
+        chunks = [
+            (ordered[a:b], None if flags is None else flags[a:b],
+             int(vertex_starts[a]), int(face_starts[a]), int(face_starts[b] - face_starts[a]))
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+        return chunks, int(vertex_starts[-1]), int(face_starts[-1])
+
+    def _gather(self, futures):
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def mesh(self, bricks, quality=DEFAULT_QUALITY):
+        """Indexed mesh (vertices, faces) of a whole design, as views of one shared buffer"""
+        return self.indexed(bricks, quality, self.mesher.stud_flags(bricks, quality))
+
+    def indexed(self, bricks, quality=DEFAULT_QUALITY, studded=None):
+        """Indexed mesh of a set of bricks with explicit per-brick stud flags (None keeps all studs)"""
+        chunks, n_verts, n_faces = self.plan(bricks, quality, studded)
+        buffer = SharedBuffer((n_verts + n_faces) * 12)
+        try:
+            pool = self.pool()
+            self._gather([pool.submit(_mesh_chunk, buffer.name, n_verts, chunk_bricks, flags, quality, v0, f0)
+                          for chunk_bricks, flags, v0, f0, _ in chunks])
+        finally:
+            buffer.unlink()
+        return buffer.array((n_verts, 3), np.float32), buffer.array((n_faces, 3), np.int32, n_verts * 12)
+
+    def iter_stl_records(self, bricks, quality=DEFAULT_QUALITY):
+        """Yield STL_RECORD arrays, one round of chunks (one per worker) at a time
+
+        Two buffers alternate so the pool tessellates the next round while the caller writes this
+        one; each yielded array is only valid until the following one is requested.
+        """
+        chunks, _, _ = self.plan(bricks, quality, self.mesher.stud_flags(bricks, quality))
+        rounds = [chunks[i:i + self.workers] for i in range(0, len(chunks), self.workers)]
+        if not rounds:
+            return
+        round_faces = max(sum(chunk[4] for chunk in r) for r in rounds)
+        buffers = [SharedBuffer(round_faces * STL_RECORD.itemsize) for _ in range(min(2, len(rounds)))]
+        pool = self.pool()
+
+        def submit(k):
+            name, offset, futures = buffers[k % len(buffers)].name, 0, []
+            for chunk_bricks, flags, _, _, count in rounds[k]:
+                futures.append(pool.submit(_stl_chunk, name, offset, chunk_bricks, flags, quality))
+                offset += count
+            return futures, offset
+
+        pending = ([], 0)
+        try:
+            pending = submit(0)
+            for k in range(len(rounds)):
+                futures, count = pending
+                self._gather(futures)
+                pending = submit(k + 1) if k + 1 < len(rounds) else ([], 0)
+                yield buffers[k % len(buffers)].array((count,), STL_RECORD)
+        finally:
+            for future in pending[0]:
+                future.cancel()
+            for buffer in buffers:
+                buffer.unlink()
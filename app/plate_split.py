@@ -0,0 +1,96 @@
+"""
+Plate Split — Cut oversized designs into bed-sized sections laid out as printer plates
+Sections follow stud and plate boundaries and are computed from brick cell bounds alone, so
+splitting never looks at a triangle
+"""
+
+import math
+
+import numpy as np
+
+try:
+    from app.mesh_engine import PLATES_PER_BRICK, brick_cells
+except ImportError:
+    from mesh_engine import PLATES_PER_BRICK, brick_cells
+
+# Plates sit bed_size * (1 + PLATE_GAP) apart, in the grid Bambu Studio and OrcaSlicer use
+PLATE_GAP = 0.2
+BED_MARGIN_MM = 5
+
+
+class DoesNotFit(ValueError):
+    pass
+
+
+def brick_boxes(bricks, mesher):
+    """(n, 6) int64 cell boxes: origin (studs, studs, plates) and size (w, d, h) per brick"""
+    sizes = {}
+    boxes = np.zeros((len(bricks), 6), dtype=np.int64)
+    for i, b in enumerate(bricks):
+        brick_type = b.get("type", mesher.default_type)
+        if brick_type not in sizes:
+            sizes[brick_type] = brick_cells(mesher.brick_info(brick_type))
+        boxes[i] = (round(b.get("x", 0)), round(b.get("y", 0)), round(b.get("z", 0) * PLATES_PER_BRICK),
+                    *sizes[brick_type])
+    return boxes
+
+
+def section_span(boxes, mesher, bed_size, margin=BED_MARGIN_MM):
+    """Largest section (studs, studs, plates) whose bricks always fit the bed
+
+    Bricks belong to the section holding their origin, so each span leaves room for the biggest
+    brick to overhang it.
+    """
+    plate_mm = mesher.height_mm / PLATES_PER_BRICK
+    bed_x, bed_y, bed_z = (float(v) for v in bed_size)
+    fit = np.array([
+        math.floor((bed_x - 2 * margin) / mesher.unit_mm),
+        math.floor((bed_y - 2 * margin) / mesher.unit_mm),
+        math.floor((bed_z - mesher.stud_height) / plate_mm),
+    ])
+    span = fit - (boxes[:, 3:].max(axis=0) - 1)
+    if (span < 1).any():
+        raise DoesNotFit(f"A single brick is larger than the {bed_x:g}×{bed_y:g}×{bed_z:g}mm bed")
+    return span
+
+
+def split_sections(bricks, mesher, bed_size, margin=BED_MARGIN_MM, boxes=None):
+    """Brick index arrays, one per bed-sized section, bottom layer band first"""
+    if not bricks:
+        return []
+    boxes = brick_boxes(bricks, mesher) if boxes is None else boxes
+    span = section_span(boxes, mesher, bed_size, margin)
+    cells = (boxes[:, :3] - boxes[:, :3].min(axis=0)) // span
+    # Sort by (z band, y, x) so lower sections come first
+    _, inverse = np.unique(cells[:, ::-1], axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+
+
+def section_bounds(boxes, mesher):
+    """(min, max) corners in mm of a set of cell boxes, studs included on top"""
+    cell_mm = np.array([mesher.unit_mm, mesher.unit_mm, mesher.height_mm / PLATES_PER_BRICK])
+    lo = boxes[:, :3].min(axis=0) * cell_mm
+    hi = (boxes[:, :3] + boxes[:, 3:]).max(axis=0) * cell_mm + np.array([0, 0, mesher.stud_height])
+    return lo, hi
+
+
+def plate_origins(count, bed_size, gap=PLATE_GAP):
+    """Bed corner in mm of each plate: a near-square grid, columns along +x and rows along -y"""
+    cols = math.ceil(math.sqrt(count)) if count else 1
+    stride = np.array([bed_size[0], bed_size[1]], dtype=np.float64) * (1 + gap)
+    return [np.array([(i % cols) * stride[0], -(i // cols) * stride[1], 0.0]) for i in range(count)]
+
+
+def layout_sections(bricks, mesher, bed_size, margin=BED_MARGIN_MM):
+    """Sections as (brick indices, mm translation) centering each one on its own plate"""
+    boxes = brick_boxes(bricks, mesher)
+    sections = split_sections(bricks, mesher, bed_size, margin, boxes)
+    bed = np.array([bed_size[0], bed_size[1], 0], dtype=np.float64)
+    placed = []
+    for indices, origin in zip(sections, plate_origins(len(sections), bed_size)):
+        lo, hi = section_bounds(boxes[indices], mesher)
+        centered = (bed - (hi - lo) * np.array([1, 1, 0])) / 2
+        placed.append((indices, origin + centered - lo))
+    return placed
@@ -7,6 +7,11 @@ from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 import json, math, time, uuid, random
 
+try:
+    from app import http_cache
+except ImportError:
+    import http_cache
+
 router = APIRouter(prefix="/api/printers", tags=["printers"])
 
 # ========== 3D PRINTER DATABASE ==========
@@ -447,9 +452,7 @@ BEST_BUY_TIMES = {
 
 # ========== API ENDPOINTS ==========
 
-@router.get("/list")
-async def list_printers():
-    """Get all printers with comparison data"""
+def _printer_list():
     printers = []
     for key, p in PRINTER_DATABASE.items():
         printers.append({
@@ -460,6 +463,15 @@ async def list_printers():
     printers.sort(key=lambda x: x.get("price_usd", 0))
     return {"printers": printers, "count": len(printers)}
 
+PRINTERS_RESPONSE = http_cache.CachedJSON(_printer_list)
+MATERIALS_RESPONSE = http_cache.CachedJSON(lambda: {"materials": MATERIALS})
+
+
+@router.get("/list")
+async def list_printers(request: Request):
+    """Get all printers with comparison data"""
+    return PRINTERS_RESPONSE.response(request)
+
 
 @router.get("/compare")
 async def compare_printers(ids: str = "bambu_a1,bambu_p1s,prusa_mk4s"):
@@ -505,9 +517,9 @@ async def recommend_printer(budget: int = 500, use_case: str = "lego"):
 
 
 @router.get("/materials")
-async def get_materials():
+async def get_materials(request: Request):
     """Get all materials with details"""
-    return {"materials": MATERIALS}
+    return MATERIALS_RESPONSE.response(request)
 
 
 @router.get("/materials/recommend")
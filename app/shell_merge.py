@@ -0,0 +1,101 @@
+"""
+Merged Shell — Hidden-face culling and greedy face merging for solid builds
+Box bricks are rasterized into a stud × stud × plate occupancy grid; only faces between filled
+and empty cells survive, and coplanar faces are merged into large rectangles
+"""
+
+import numpy as np
+
+try:
+    from app.mesh_engine import (BOX_SHAPES, DEFAULT_QUALITY, PLATES_PER_BRICK, covered_cells, instance_mesh,
+                                 merge_meshes, occupancy_grid)
+except ImportError:
+    from mesh_engine import (BOX_SHAPES, DEFAULT_QUALITY, PLATES_PER_BRICK, covered_cells, instance_mesh,
+                             merge_meshes, occupancy_grid)
+
+# For a face normal along axis a, the in-plane axes (u, v) in cyclic order so that u × v = +a
+_PLANE_AXES = {0: (1, 2), 1: (2, 0), 2: (0, 1)}
+
+
+def greedy_rectangles(mask):
+    """Merge a 2D boolean mask into rectangles (r0, c0, r1, c1), half-open
+
+    Each row is split into runs of filled cells; a run is extended downward for as long as the
+    next row has exactly the same run.
+    """
+    rects = []
+    open_runs = {}
+    padded = np.zeros(mask.shape[1] + 2, dtype=np.int8)
+    for r in range(mask.shape[0]):
+        padded[1:-1] = mask[r]
+        edges = np.diff(padded)
+        runs = set(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+        for run in [run for run in open_runs if run not in runs]:
+            rects.append((open_runs.pop(run), run[0], r, run[1]))
+        for run in runs:
+            open_runs.setdefault(run, r)
+    for run, r0 in open_runs.items():
+        rects.append((r0, run[0], mask.shape[0], run[1]))
+    return rects
+
+
+def shell_quads(grid):
+    """Merged boundary quads of a grid as (corners (n, 4, 3) int, flip (n,) bool)"""
+    corners, flips = [], []
+    if not grid.size:
+        # No box bricks at all: nothing to slice
+        return np.zeros((0, 4, 3), dtype=np.int64), np.zeros(0, dtype=bool)
+    padded = np.pad(grid, 1)
+    for axis, (u, v) in _PLANE_AXES.items():
+        for direction in (1, -1):
+            # Faces of filled cells whose neighbour in this direction is empty
+            neighbour = np.roll(padded, -direction, axis=axis)
+            exposed = (padded & ~neighbour)[1:-1, 1:-1, 1:-1]
+            slices = np.transpose(exposed, (axis, u, v))
+            for k in np.flatnonzero(slices.reshape(len(slices), -1).any(axis=1)):
+                plane = k + (1 if direction > 0 else 0)
+                for r0, c0, r1, c1 in greedy_rectangles(slices[k]):
+                    quad = np.zeros((4, 3), dtype=np.int64)
+                    quad[:, axis] = plane
+                    quad[:, u] = (r0, r1, r1, r0)
+                    quad[:, v] = (c0, c0, c1, c1)
+                    corners.append(quad)
+                    flips.append(direction < 0)
+    if not corners:
+        return np.zeros((0, 4, 3), dtype=np.int64), np.zeros(0, dtype=bool)
+    return np.stack(corners), np.array(flips)
+
+
+def merged_shell(bricks, mesher, quality=DEFAULT_QUALITY):
+    """Indexed mesh of a design with internal faces culled and coplanar faces merged
+
+    Box-shaped bricks become one welded shell plus their exposed studs; other shapes are
+    instanced from the mesher's templates unchanged.
+    """
+    grid, origin, studs = occupancy_grid(bricks, mesher)
+    cell_mm = np.array([mesher.unit_mm, mesher.unit_mm, mesher.height_mm / PLATES_PER_BRICK])
+    parts = []
+
+    corners, flips = shell_quads(grid)
+    if len(corners):
+        # Weld shared lattice corners, then split each quad into two outward-facing triangles
+        lattice, index = np.unique(corners.reshape(-1, 3), axis=0, return_inverse=True)
+        quads = index.reshape(-1, 4)
+        tri_a = quads[:, [0, 1, 2]]
+        tri_b = quads[:, [0, 2, 3]]
+        tri_a[flips] = tri_a[flips][:, ::-1]
+        tri_b[flips] = tri_b[flips][:, ::-1]
+        faces = np.stack([tri_a, tri_b], axis=1).reshape(-1, 3).astype(np.int32)
+        parts.append((((lattice + origin) * cell_mm).astype(np.float32), faces))
+
+    stud_v, stud_f = mesher.stud_template(quality)
+    visible = studs[~covered_cells(grid, origin, studs)]
+    if len(visible):
+        centers = (visible + np.array([0.5, 0.5, 0])) * cell_mm
+        parts.append(instance_mesh(stud_v, stud_f, centers.astype(np.float32)))
+
+    others = [b for b in bricks
+              if mesher.brick_info(b.get("type", mesher.default_type)).get("shape", "box") not in BOX_SHAPES]
+    if others:
+        parts.append(mesher.mesh(others, quality))
+    return merge_meshes(parts)
@@ -0,0 +1,296 @@
+"""
+Voxel Union — Watertight single-body export via voxel surface extraction
+Brick bodies and studs are rasterized into one NumPy volume; the boundary between filled and
+empty voxels is extracted as a single welded, manifold surface
+"""
+
+import numpy as np
+
+try:
+    from app.mesh_engine import BOX_SHAPES, PLATES_PER_BRICK, slope_rows
+except ImportError:
+    from mesh_engine import BOX_SHAPES, PLATES_PER_BRICK, slope_rows
+
+DEFAULT_VOXEL_MM = 0.8
+MIN_VOXEL_MM = 0.2
+MAX_VOXELS = 64_000_000
+MAX_REPAIR_PASSES = 8
+
+# For a face normal along axis a, the in-plane axes (u, v) in cyclic order so that u × v = +a
+_PLANE_AXES = {0: (1, 2), 1: (2, 0), 2: (0, 1)}
+
+
+class VolumeTooLarge(ValueError):
+    pass
+
+
+# ========== SOLID PRIMITIVES ==========
+
+# Shaped bodies are tested per voxel center, on coordinates normalized to the solid's bounding box
+# with every axis running from -0.5 to 0.5
+
+def _frustum(top):
+    """Round solid narrowing linearly from the full box width at the bottom to top × that width"""
+    def inside(x, y, z):
+        r = 0.5 * (1 + (top - 1) * (z + 0.5))
+        return x * x + y * y <= r * r
+    return inside
+
+
+def _dome(x, y, z):
+    # Quarter-ellipse profile from the rim at the bottom up to the apex
+    return 4 * (x * x + y * y) + (z + 0.5) ** 2 <= 1
+
+
+def _torus(x, y, z):
+    # Ring radius 0.35 and tube radius 0.15, as in mesh_engine.primitive_mesh
+    return (np.sqrt(x * x + y * y) - 0.35) ** 2 + z * z <= 0.15 ** 2
+
+
+def _tube(x, y, z):
+    return (0.3 ** 2 <= x * x + y * y) & (x * x + y * y <= 0.25)
+
+
+# Custom shape types other than "cube" (a plain box), same unit solids as primitive_mesh
+SHAPE_SOLIDS = {
+    "sphere": lambda x, y, z: x * x + y * y + z * z <= 0.25,
+    "cylinder": _frustum(1.0),
+    "cone": _frustum(0.0),
+    "torus": _torus,
+    "pyramid": lambda x, y, z: np.maximum(np.abs(x), np.abs(y)) <= (0.5 - z) / 2,
+    "wedge": lambda x, y, z: y + z <= 0,
+    "tube": _tube,
+}
+
+
+def _slope(lip, flat):
+    """Slope rising along y from a lip at the front to a flat back strip (fractions of the box)"""
+    def inside(x, y, z):
+        top = np.minimum(1.0, lip + (1 - lip) * (y + 0.5) / max(1 - flat, 1e-9))
+        return z + 0.5 <= top
+    return inside
+
+
+def _shaped_brick(info, mesher):
+    """Inside test of a non-box brick body, matching BrickMesher.build_template, or None"""
+    radius = min(info["width"], info["depth"]) * mesher.unit_mm / 2
+    shape = info.get("shape", "box")
+    if shape == "slope":
+        return _slope(1 / (info["height"] * PLATES_PER_BRICK), slope_rows(info) / info["depth"])
+    if shape == "cylinder":
+        return _frustum(1.0)
+    if shape == "cone":
+        return _frustum(min(mesher.stud_radius, radius) / radius)
+    if shape == "dome":
+        return _dome
+    return None
+
+
+# ========== RASTERIZATION ==========
+
+def unsupported_shapes(shapes):
+    """Sorted custom shape types that have no voxel form"""
+    return sorted({str(s.get("type", "cube")) for s in shapes} - {"cube", *SHAPE_SOLIDS})
+
+
+def design_solids(bricks, mesher, shapes=()):
+    """Solids of a design in mm: axis-aligned boxes (n, 6), stud cylinders (m, 4: cx, cy, z, height)
+    and shaped bodies as (inside test, bounds) pairs
+
+    Raises ValueError naming any brick or custom shape type that cannot be voxelized.
+    """
+    boxes, studs, solids, unsupported = [], [], [], set()
+    for b in bricks:
+        brick_type = b.get("type", mesher.default_type)
+        info = mesher.brick_info(brick_type)
+        x = b.get("x", 0) * mesher.unit_mm
+        y = b.get("y", 0) * mesher.unit_mm
+        z = b.get("z", 0) * mesher.height_mm
+        w = info["width"] * mesher.unit_mm
+        d = info["depth"] * mesher.unit_mm
+        h = info["height"] * mesher.height_mm
+        if info.get("shape", "box") in BOX_SHAPES:
+            boxes.append((x, y, z, x + w, y + d, z + h))
+            for sw in range(int(info["width"])):
+                for sd in range(int(info["depth"])):
+                    studs.append((x + (sw + 0.5) * mesher.unit_mm, y + (sd + 0.5) * mesher.unit_mm, z + h, mesher.stud_height))
+            continue
+        inside = _shaped_brick(info, mesher)
+        if inside is None:
+            unsupported.add(brick_type)
+            continue
+        if info.get("shape") == "slope":
+            solids.append((inside, (x, y, z, x + w, y + d, z + h)))
+            for sw in range(int(info["width"])):
+                for sd in range(int(info["depth"]) - slope_rows(info), int(info["depth"])):
+                    studs.append((x + (sw + 0.5) * mesher.unit_mm, y + (sd + 0.5) * mesher.unit_mm, z + h, mesher.stud_height))
+            continue
+        r = min(w, d) / 2
+        cx, cy = x + w / 2, y + d / 2
+        solids.append((inside, (cx - r, cy - r, z, cx + r, cy + r, z + h)))
+        if info.get("shape") != "dome" and info.get("studs", 0):
+            studs.append((cx, cy, z + h, mesher.stud_height))
+    if unsupported:
+        raise ValueError(f"Cannot build a watertight body from bricks of type: {', '.join(sorted(unsupported))}")
+    unknown = unsupported_shapes(shapes)
+    if unknown:
+        raise ValueError(f"Cannot build a watertight body from shapes of type: {', '.join(unknown)}")
+    for s in shapes:
+        half = s.get("scale", 10) / 2
+        sx, sy, sz = s.get("x", 0), s.get("y", 0), s.get("z", 0)
+        bounds = (sx - half, sy - half, sz - half, sx + half, sy + half, sz + half)
+        kind = s.get("type", "cube")
+        if kind == "cube":
+            boxes.append(bounds)
+        else:
+            solids.append((SHAPE_SOLIDS[kind], bounds))
+    return np.array(boxes, dtype=np.float64).reshape(-1, 6), np.array(studs, dtype=np.float64).reshape(-1, 4), solids
+
+
+def rasterize(boxes, studs, stud_radius, voxel_mm, solids=()):
+    """Fill a boolean volume; returns (volume, origin_mm) with a one-voxel empty border"""
+    bounds = np.concatenate([boxes, np.array([b for _, b in solids], dtype=np.float64).reshape(-1, 6)])
+    lo, hi = bounds[:, :3].min(axis=0), bounds[:, 3:].max(axis=0)
+    if len(studs):
+        lo = np.minimum(lo, (studs[:, :3] - [stud_radius, stud_radius, 0]).min(axis=0))
+        hi = np.maximum(hi, (studs[:, :3] + [stud_radius, stud_radius, 0]).max(axis=0) + [0, 0, studs[:, 3].max()])
+    origin = np.floor(lo / voxel_mm) * voxel_mm - voxel_mm
+    shape = np.ceil((hi - origin) / voxel_mm).astype(np.int64) + 2
+    if int(np.prod(shape)) > MAX_VOXELS:
+        raise VolumeTooLarge(
+            f"Design needs {int(np.prod(shape)):,} voxels at {voxel_mm}mm (limit {MAX_VOXELS:,}); use a larger voxel_mm")
+
+    vol = np.zeros(tuple(shape), dtype=bool)
+    cells = np.rint((boxes - np.tile(origin, 2)) / voxel_mm).astype(np.int64)
+    for x0, y0, z0, x1, y1, z1 in cells.tolist():
+        vol[x0:x1, y0:y1, z0:z1] = True
+
+    for inside, solid in solids:
+        # Voxels whose centers lie in [low, high) of the bounds, as for boxes, and pass the inside test
+        solid = np.asarray(solid)
+        first = np.ceil((solid[:3] - origin) / voxel_mm - 0.5).astype(np.int64)
+        last = np.ceil((solid[3:] - origin) / voxel_mm - 0.5).astype(np.int64)
+        center, size = (solid[:3] + solid[3:]) / 2, solid[3:] - solid[:3]
+        x, y, z = (((np.arange(first[k], last[k]) + 0.5) * voxel_mm + origin[k] - center[k]) / size[k] for k in range(3))
+        mask = inside(x[:, None, None], y[None, :, None], z[None, None, :])
+        vol[first[0]:last[0], first[1]:last[1], first[2]:last[2]] |= mask
+
+    if len(studs):
+        # Voxels whose centers fall inside each stud's circle, all studs in one broadcast
+        r = int(np.ceil(stud_radius / voxel_mm)) + 1
+        window = np.stack(np.meshgrid(np.arange(-r, r + 1), np.arange(-r, r + 1), indexing="ij"), axis=-1).reshape(-1, 2)
+        center = (studs[:, :2] - origin[:2]) / voxel_mm
+        ij = np.floor(center)[:, None, :].astype(np.int64) + window[None, :, :]
+        inside = np.sum((ij + 0.5 - center[:, None, :]) ** 2, axis=2) <= (stud_radius / voxel_mm) ** 2
+        z0 = np.rint((studs[:, 2] - origin[2]) / voxel_mm).astype(np.int64)
+        z1 = np.rint((studs[:, 2] + studs[:, 3] - origin[2]) / voxel_mm).astype(np.int64)
+        for layer in range(int((z1 - z0).max())):
+            rows = inside & ((z0 + layer) < z1)[:, None]
+            stud_idx, cell_idx = np.nonzero(rows)
+            vol[ij[stud_idx, cell_idx, 0], ij[stud_idx, cell_idx, 1], z0[stud_idx] + layer] = True
+    return vol, origin
+
+
+# ========== MANIFOLD REPAIR ==========
+
+def repair_manifold(vol):
+    """Fill voxels so no two solids touch only along an edge or at a corner; returns voxels added"""
+    added = 0
+    for _ in range(MAX_REPAIR_PASSES):
+        fixed = 0
+        # Edge contacts: diagonal pairs in a 2x2 block whose other two cells are empty (and the inverse)
+        for axis, (u, v) in _PLANE_AXES.items():
+            view = np.moveaxis(vol, (u, v), (0, 1))
+            a, b, c, d = view[:-1, :-1], view[1:, 1:], view[1:, :-1], view[:-1, 1:]
+            diagonal = (a & b & ~c & ~d) | (c & d & ~a & ~b)
+            if diagonal.any():
+                i, j, k = np.nonzero(diagonal)
+                view[i + 1, j, k] = True
+                view[i, j, k] = True
+                fixed += len(i)
+        # Corner contacts: exactly two opposite corners of a 2x2x2 block filled, or exactly two empty
+        corners = [vol[dx:vol.shape[0] - 1 + dx, dy:vol.shape[1] - 1 + dy, dz:vol.shape[2] - 1 + dz]
+                   for dx in (0, 1) for dy in (0, 1) for dz in (0, 1)]
+        filled = sum(c.astype(np.int8) for c in corners)
+        for p in range(4):
+            q = 7 - p
+            single = (filled == 2) & corners[p] & corners[q]
+            hole = (filled == 6) & ~corners[p] & ~corners[q]
+            bad = single | hole
+            if bad.any():
+                i, j, k = np.nonzero(bad)
+                # Fill the cell next to corner p that bridges toward corner q
+                di, dj, dk = (p >> 2) & 1, (p >> 1) & 1, p & 1
+                qi, qj, qk = (q >> 2) & 1, (q >> 1) & 1, q & 1
+                vol[i + qi, j + dj, k + dk] = True
+                vol[i + di, j + dj, k + dk] = True
+                vol[i + qi, j + qj, k + dk] = True
+                fixed += len(i)
+        added += fixed
+        if not fixed:
+            break
+    return added
+
+
+# ========== SURFACE EXTRACTION ==========
+
+def extract_surface(vol):
+    """Welded boundary mesh of a volume in voxel-lattice coordinates: (vertices int, faces)"""
+    corners = []
+    for axis, (u, v) in _PLANE_AXES.items():
+        for direction in (1, -1):
+            neighbour = np.roll(vol, -direction, axis=axis)
+            cells = np.argwhere(vol & ~neighbour)
+            quad = np.repeat(cells[:, None, :], 4, axis=1)
+            if direction > 0:
+                quad[:, :, axis] += 1
+            quad[:, [1, 2], u] += 1
+            quad[:, [2, 3], v] += 1
+            if direction < 0:
+                quad = quad[:, ::-1]
+            corners.append(quad)
+    corners = np.concatenate(corners)
+    lattice, index = np.unique(corners.reshape(-1, 3), axis=0, return_inverse=True)
+    quads = index.reshape(-1, 4)
+    faces = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]]).astype(np.int32)
+    return lattice, faces
+
+
+def manifold_stats(n_verts, faces):
+    """Edge-based topology report of an indexed triangle mesh"""
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    _, uses = np.unique(edges, axis=0, return_counts=True)
+    boundary = int(np.sum(uses == 1))
+    nonmanifold = int(np.sum(uses > 2))
+    return {
+        "vertices": int(n_verts),
+        "triangles": int(len(faces)),
+        "edges": int(len(uses)),
+        "boundary_edges": boundary,
+        "nonmanifold_edges": nonmanifold,
+        "euler_characteristic": int(n_verts - len(uses) + len(faces)),
+        "watertight": boundary == 0 and nonmanifold == 0,
+    }
+
+
+def watertight_mesh(bricks, mesher, voxel_mm=DEFAULT_VOXEL_MM, shapes=()):
+    """One welded, watertight body for a whole design: (vertices, faces, stats)"""
+    voxel_mm = max(float(voxel_mm), MIN_VOXEL_MM)
+    boxes, studs, solids = design_solids(bricks, mesher, shapes)
+    if not len(boxes) and not solids:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int32), manifold_stats(0, np.zeros((0, 3), dtype=np.int32))
+
+    vol, origin = rasterize(boxes, studs, mesher.stud_radius, voxel_mm, solids)
+    repaired = repair_manifold(vol)
+    lattice, faces = extract_surface(vol)
+    verts = (lattice * voxel_mm + origin).astype(np.float32)
+
+    stats = manifold_stats(len(verts), faces)
+    stats.update({
+        "voxel_mm": voxel_mm,
+        "grid": list(vol.shape),
+        "filled_voxels": int(vol.sum()),
+        "volume_mm3": round(float(vol.sum()) * voxel_mm ** 3, 1),
+        "repaired_voxels": repaired,
+    })
+    return verts, faces, stats